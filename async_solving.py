@@ -0,0 +1,248 @@
+'''
+Solvers for asyncio programs: searches that give the event loop a turn
+every so often, can be cancelled or given a deadline, can run in an
+executor instead, and share one search among identical concurrent requests.
+'''
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+
+import water_pouring
+import subway_planning
+from water_pouring import (Fail, build_path, join_paths, search_stream,
+                           no_heuristic, bridge_successors2, bridge_goal,
+                           bridge_cost, more_pour_successors, pour_heuristic,
+                           INFINITY)
+from subway_planning import boston
+
+YIELD_EVERY = 1000  # expansions between turns of the event loop
+
+
+async def shortest_path_search(start, successors, is_goal,
+                               yield_every=YIELD_EVERY):
+    """water_pouring.shortest_path_search, letting other tasks run after
+    every yield_every expansions (which is also where it can be cancelled)."""
+    if is_goal(start):
+        return [start]
+    parents = {start: None}
+    frontier = collections.deque([start])
+    expanded = 0
+    while frontier:
+        last_state = frontier.popleft()
+        for (state, action) in successors(last_state).items():
+            if state not in parents:
+                parents[state] = (last_state, action)
+                if is_goal(state):
+                    return build_path(parents, state)
+                frontier.append(state)
+        expanded += 1
+        if expanded % yield_every == 0:
+            await asyncio.sleep(0)
+    return Fail
+
+
+async def bidirectional_search(start, goal, successors, predecessors=None,
+                               yield_every=YIELD_EVERY):
+    """water_pouring.bidirectional_search (finding the same path), letting
+    other tasks run after every yield_every expansions."""
+    if predecessors is None:
+        predecessors = successors
+    if start == goal:
+        return [start]
+    forward, backward = {start: None}, {goal: None}
+    depths = {start: 0}, {goal: 0}
+    layers = [start], [goal]
+    expanded = 0
+    while layers[0] and layers[1]:
+        side = 0 if len(layers[0]) <= len(layers[1]) else 1
+        expand = successors if side == 0 else predecessors
+        mine, other = (forward, backward) if side == 0 else (backward,
+                                                             forward)
+        depth, other_depth = depths[side], depths[1 - side]
+        meet, shortest, layer = None, INFINITY, []
+        for last_state in layers[side]:
+            for (state, action) in expand(last_state).items():
+                if state not in mine:
+                    mine[state] = (last_state, action)
+                    depth[state] = depth[last_state] + 1
+                    layer.append(state)
+                    if state in other and other_depth[state] < shortest:
+                        meet, shortest = state, other_depth[state]
+            expanded += 1
+            if expanded % yield_every == 0:
+                await asyncio.sleep(0)
+        if meet is not None:
+            return join_paths(forward, backward, meet)
+        layers = (layer, layers[1]) if side == 0 else (layers[0], layer)
+    return Fail
+
+
+async def lowest_cost_search(start, successors, is_goal, action_cost,
+                             heuristic=no_heuristic, yield_every=YIELD_EVERY):
+    """Find a lowest cost path like water_pouring.lowest_cost_search (of the
+    same cost, though ties may be broken differently), letting other tasks
+    run after every yield_every expansions."""
+    for kind, value in search_stream(start, successors, is_goal, action_cost,
+                                     heuristic, progress_every=yield_every):
+        if kind == 'goal':
+            return value
+        await asyncio.sleep(0)
+    return Fail
+
+
+_in_flight = {}  # key: [task, number of callers waiting for it]
+
+
+async def coalesce(key, make_coroutine):
+    """Return the result of make_coroutine(), but if a call with the same key
+    is already running, wait for its result instead of starting another.
+    A caller that is cancelled (or times out) stops waiting; the search is
+    cancelled only when nobody is left waiting for it."""
+    entry = _in_flight.get(key)
+    if entry is None:
+        entry = _in_flight[key] = [asyncio.ensure_future(make_coroutine()), 0]
+
+        def forget(_):
+            if _in_flight.get(key) is entry:
+                del _in_flight[key]
+
+        entry[0].add_done_callback(forget)
+    entry[1] += 1
+    try:
+        # A copy each, so that no caller can change another's result.
+        return list(await asyncio.shield(entry[0]))
+    except asyncio.CancelledError:
+        if entry[1] == 1:
+            entry[0].cancel()
+        raise
+    finally:
+        entry[1] -= 1
+
+
+async def solve(key, search, solver, args, timeout=None, executor=None):
+    """Run search(*args) on the loop, or solver(*args) in executor if one is
+    given, sharing it with identical requests (those with the same key);
+    raise asyncio.TimeoutError if it takes longer than timeout seconds.
+    (A solver already running in an executor cannot be stopped; only the
+    wait for it is.)"""
+    if executor is not None:
+        loop = asyncio.get_running_loop()
+        key += ('executor', )
+
+        def make_coroutine():
+            return loop.run_in_executor(executor, functools.partial(
+                solver, *args))
+    else:
+
+        def make_coroutine():
+            return search(*args)
+
+    return await asyncio.wait_for(coalesce(key, make_coroutine), timeout)
+
+
+async def ride(here, there, system=boston, timeout=None, executor=None,
+               yield_every=YIELD_EVERY):
+    """A shortest path on the subway system from here to there: the same
+    one as subway_planning.ride, in an executor or not."""
+
+    def search(here, there, system):
+        return bidirectional_search(here, there,
+                                    subway_planning.successors(system),
+                                    yield_every=yield_every)
+
+    return await solve(('ride', here, there, id(system)), search,
+                       subway_planning.ride, (here, there, system), timeout,
+                       executor)
+
+
+async def bridge_problem(here, timeout=None, executor=None,
+                         yield_every=YIELD_EVERY):
+    "A fastest path for the people here to cross the bridge."
+
+    def search(here):
+        start = (frozenset(here) | frozenset(['light']), frozenset())
+        return lowest_cost_search(start, bridge_successors2, bridge_goal,
+                                  bridge_cost, yield_every=yield_every)
+
+    return await solve(('bridge', tuple(sorted(here))), search,
+                       water_pouring.bridge_problem, (list(here), ), timeout,
+                       executor)
+
+
+async def more_pour_problem(capacities, goal, start=None, timeout=None,
+                            executor=None, yield_every=YIELD_EVERY):
+    "A shortest path to goal in some glass, as in more_pour_problem."
+    capacities = tuple(capacities)
+    if start is None:
+        start = (0, ) * len(capacities)
+
+    async def search(capacities, goal, start):
+        if pour_heuristic(capacities, goal)(start) == INFINITY:
+            return Fail
+        return await shortest_path_search(start,
+                                          more_pour_successors(capacities),
+                                          lambda state: goal in state,
+                                          yield_every)
+
+    return await solve(('more_pour', capacities, goal, tuple(start)), search,
+                       water_pouring.more_pour_problem,
+                       (capacities, goal, tuple(start)), timeout, executor)
+
+
+def test_async_solving():
+    "async solving tests."
+
+    async def main():
+        assert await ride('mit', 'government') == subway_planning.ride(
+            'mit', 'government')
+        paths = await asyncio.gather(
+            bridge_problem([1, 2, 5, 10]), bridge_problem([10, 5, 2, 1]),
+            more_pour_problem((1, 3, 9, 27), 13, yield_every=1))
+        assert paths[0] == paths[1] and paths[0] is not paths[1]
+        assert water_pouring.elapsed_time(paths[0]) == 17
+        assert paths[2] == water_pouring.more_pour_problem((1, 3, 9, 27), 13)
+        assert not _in_flight
+
+        ticks = []
+
+        async def ticker():
+            for i in range(5):
+                ticks.append(i)
+                await asyncio.sleep(0)
+
+        path, _ = await asyncio.gather(
+            more_pour_problem((13, 29, 61), 60, yield_every=10), ticker())
+        assert len(ticks) == 5 and 60 in path[-1]
+
+        try:
+            await more_pour_problem((13, 29, 61, 97), 60, timeout=0.001,
+                                    yield_every=1)
+            assert False, 'expected a timeout'
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(0)
+        assert not _in_flight  # the timed out search was cancelled
+
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            path = await more_pour_problem((4, 9), 6, executor=executor)
+            assert path == water_pouring.more_pour_problem((4, 9), 6)
+            path = await ride('newton', 'alewife', executor=executor)
+            assert path == subway_planning.ride('newton', 'alewife')
+            system = subway_planning.synthetic_subway(200, 8, seed=3)
+            stations = sorted(system)[::10]
+            for here in stations:
+                for there in stations:
+                    path = subway_planning.ride(here, there, system)
+                    assert await ride(here, there, system,
+                                      yield_every=7) == path
+                    assert await ride(here, there, system,
+                                      executor=executor) == path
+
+    asyncio.run(main())
+    print('test_async_solving passes')
+
+
+if __name__ == '__main__':
+    test_async_solving()
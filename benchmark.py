@@ -0,0 +1,202 @@
+'''
+Benchmarks: run every solver over growing problem sizes, record time,
+states expanded and peak memory, and compare against a saved baseline.
+
+    python benchmark.py --save baseline.json      # record a baseline
+    python benchmark.py --compare baseline.json   # fail on regressions
+    python benchmark.py --test                    # run the tests
+'''
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from water_pouring import (SearchStats, pour_problem, more_pour_problem,
+                           more_pour_successors, bridge_problem,
+                           canonical_bridge_problem, shortest_path_search,
+                           missionaries_cannibals_successors,
+                           general_missionaries_cannibals)
+from subway_planning import synthetic_subway, longest_ride, clear_route_indexes
+
+
+def pour_case(X, Y, goal):
+    def run(stats):
+        return pour_problem(X, Y, goal, stats=stats)
+
+    return 'pour_problem(%d, %d, %d)' % (X, Y, goal), run
+
+
+def more_pour_case(capacities, goal, packed=False):
+    def run(stats):
+        if packed:
+            return more_pour_problem(capacities, goal, packed=True)
+        start = (0, ) * len(capacities)
+        return shortest_path_search(start, more_pour_successors(capacities),
+                                    lambda state: goal in state, stats)
+
+    name = 'more_pour_problem(%r, %d%s)' % (capacities, goal,
+                                            ', packed' if packed else '')
+    return name, run
+
+
+def bridge_case(here, canonical=False):
+    def run(stats):
+        if canonical:
+            return canonical_bridge_problem(here, stats)
+        return bridge_problem(here, stats)
+
+    solver = 'canonical_bridge_problem' if canonical else 'bridge_problem'
+    return '%s(%d people)' % (solver, len(here)), run
+
+
+def missionaries_case(n, general=False):
+    def run(stats):
+        if general:
+            return general_missionaries_cannibals(n, n)
+        start = (n, n, 1, 0, 0, 0)
+        goal = (0, 0, 0) + start[:3]
+        return shortest_path_search(start, missionaries_cannibals_successors,
+                                    lambda state: state == goal, stats)
+
+    solver = ('general_missionaries_cannibals'
+              if general else 'missionaries_cannibals_problem')
+    return '%s(%d, %d)' % (solver, n, n), run
+
+
+def longest_ride_case(stations, lines):
+    system = synthetic_subway(stations, lines)
+
+    def run(stats):
+        clear_route_indexes()
+        return longest_ride(system)
+
+    return 'longest_ride(%d stations, %d lines)' % (stations, lines), run
+
+
+def cases(quick=False):
+    "Return the (name, run) benchmark cases, fewer and smaller if quick."
+    pours = [(97, 101, 50), (997, 1009, 500), (9973, 10007, 5000)]
+    more_pours = [((13, 29, 61), 60), ((13, 29, 61, 97), 60),
+                  ((13, 29, 61, 97, 101), 60)]
+    crowds = [[1, 2, 5, 10, 15, 20, 25, 30][:n] for n in (4, 6, 8)]
+    canonical_crowds = [list(range(1, n + 1)) for n in (10, 20, 40)]
+    missionaries = [3, 10, 30]
+    rides = [(100, 5), (500, 20), (2000, 60)]
+    if quick:
+        pours, more_pours, crowds = pours[:2], more_pours[:2], crowds[:2]
+        canonical_crowds, missionaries = canonical_crowds[:2], missionaries[:2]
+        rides = rides[:2]
+    result = [pour_case(*args) for args in pours]
+    result += [more_pour_case(*args) for args in more_pours]
+    result += [more_pour_case(*args, packed=True) for args in more_pours]
+    result += [bridge_case(here) for here in crowds]
+    result += [bridge_case(here, True) for here in canonical_crowds]
+    result += [missionaries_case(n) for n in missionaries]
+    result += [missionaries_case(n, True) for n in missionaries]
+    result += [longest_ride_case(*args) for args in rides]
+    return result
+
+
+def measure(run, repeat=3):
+    """Return {'seconds': best time of repeat runs, 'expanded': states
+    expanded (None if the solver does not report it), 'peak_kb': peak
+    memory allocated during one more run}."""
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(None)
+        seconds.append(time.perf_counter() - started)
+    stats = SearchStats()
+    tracemalloc.start()
+    run(stats)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': min(seconds),
+        'expanded': stats.expanded if stats.started is not None else None,
+        'peak_kb': peak // 1024
+    }
+
+
+def regressions(results, baseline, threshold=1.5, noise=0.005):
+    """Return a description of every result worse than its baseline: more
+    states expanded at all, or more than threshold times the time (beyond
+    noise seconds) or memory."""
+    found = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result['seconds'] > max(old['seconds'] * threshold,
+                                   old['seconds'] + noise):
+            found.append('%s: %.4fs, was %.4fs' % (name, result['seconds'],
+                                                   old['seconds']))
+        if old['expanded'] is not None and result['expanded'] is not None and (
+                result['expanded'] > old['expanded']):
+            found.append('%s: expanded %d, was %d' % (name, result['expanded'],
+                                                      old['expanded']))
+        if result['peak_kb'] > max(old['peak_kb'] * threshold,
+                                   old['peak_kb'] + 64):
+            found.append('%s: peak %d KB, was %d KB' % (name, result['peak_kb'],
+                                                        old['peak_kb']))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--quick', action='store_true',
+                        help='fewer and smaller problems')
+    parser.add_argument('--only', default='',
+                        help='run only cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results to FILE as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='fail if results regress from the FILE baseline')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='allowed slowdown factor (default 1.5)')
+    parser.add_argument('--test', action='store_true',
+                        help='run the tests of this module instead')
+    args = parser.parse_args(argv)
+    if args.test:
+        test_regressions()
+        return 0
+
+    results = {}
+    for name, run in cases(args.quick):
+        if args.only in name:
+            results[name] = measure(run, args.repeat)
+            print('%-60s %9.4fs %9s expanded %8d KB' %
+                  (name, results[name]['seconds'], results[name]['expanded'],
+                   results[name]['peak_kb']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(results, json.load(f), args.threshold)
+        for line in found:
+            print('REGRESSION', line)
+        return 1 if found else 0
+    return 0
+
+
+def test_regressions():
+    "benchmark regression gate tests."
+    baseline = {'a': {'seconds': 1.0, 'expanded': 10, 'peak_kb': 100}}
+    assert not regressions({'a': {'seconds': 1.4, 'expanded': 10,
+                                  'peak_kb': 140}}, baseline)
+    assert len(regressions({'a': {'seconds': 1.6, 'expanded': 11,
+                                  'peak_kb': 400}}, baseline)) == 3
+    assert not regressions({'b': {'seconds': 9, 'expanded': 9,
+                                  'peak_kb': 9}}, baseline)
+    name, run = pour_case(4, 9, 6)
+    result = measure(run, repeat=1)
+    assert result['expanded'] > 0 and result['seconds'] > 0
+    print('test_regressions passes')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
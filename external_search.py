@@ -0,0 +1,333 @@
+'''
+Breadth-first search with the explored states and the frontier on disk,
+for state spaces too big for memory.
+'''
+
+import heapq
+import mmap
+import operator
+import os
+import shutil
+import struct
+import tempfile
+
+from water_pouring import (Fail, more_pour_problem, more_pour_successors,
+                           pour_reachable, missionaries_cannibals_problem,
+                           missionaries_cannibals_successors)
+
+# A record is (state code, order, parent state code).  In a layer file the
+# order is the state's position in the layer of the in-memory search; in a
+# file of generated successors it is parent position * MAX_SUCCESSORS + the
+# position of the successor among those of its parent.
+RECORD = struct.Struct('<QQQ')
+CODE = struct.Struct('<Q')  # the records of the file of all seen states
+MAX_SUCCESSORS = 1 << 20
+BLOCK = 4096  # records read at a time from each file
+FAN_IN = 64  # most files merged at once
+
+
+def external_shortest_path_search(start, successors, is_goal, encode,
+                                  decode, memory=1000000, directory=None):
+    """Find the same shortest path as shortest_path_search, keeping no more
+    than memory records in memory at a time for sorting (besides a block of
+    BLOCK records for each of the at most FAN_IN files being merged);
+    everything else is in files in directory (a new temporary one, removed
+    at the end, if None).  encode(state) must number the states
+    0 <= code < 2**64 and decode(code) turn the number back into the state.
+    Each layer of the search is a file of records sorted by state code, and
+    one more file has the codes of every state seen so far, sorted.  The
+    successors of a layer are sorted, merged with the seen file to keep only
+    the new states, and the new layer is then merged into the seen file, so
+    each step reads a fixed number of files however deep the search goes.
+    Each new state remembers the smallest (parent position, successor
+    position) that reached it; sorting the new states by that gives the
+    order, and so the parents and the goal, of the in-memory search.  The
+    path is followed back through the layer files, mapped into memory and
+    searched by bisection."""
+    if is_goal(start):
+        return [start]
+    temporary = directory is None
+    if temporary:
+        directory = tempfile.mkdtemp(prefix='bfs')
+    size = max(memory // 3, 1)  # a layer runs three sorts at once
+    try:
+        code = encode(start)
+        layers = [layer_file(directory, 0)]
+        write_records(layers[0], [(code, 0, code)])
+        seen = os.path.join(directory, 'seen')
+        write_records(seen, [(code, )], CODE)
+        while True:
+            generated = external_sort(
+                expand_layer(layers[-1], successors, encode, decode), None,
+                size, directory)
+            new = external_sort(first_new(generated, seen), order_key, size,
+                                directory)
+            found = []
+
+            def ranked():
+                for rank, (code, _, parent) in enumerate(new):
+                    if is_goal(decode(code)):
+                        found.append((code, parent))
+                        return
+                    yield (code, rank, parent)
+
+            records = external_sort(ranked(), None, size, directory)
+            filename = layer_file(directory, len(layers))
+            count = write_records(filename, records)
+            new.close()  # a goal may have left it unfinished
+            if found:
+                return follow_back(found[0], layers, successors, decode)
+            if not count:
+                return Fail
+            layers.append(filename)
+            merge_seen(seen, filename, directory)
+    finally:
+        if temporary:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+order_key = operator.itemgetter(1)
+
+
+def layer_file(directory, depth):
+    return os.path.join(directory, 'layer%d' % depth)
+
+
+def expand_layer(filename, successors, encode, decode):
+    "Yield a record for every successor of every state of a layer file."
+    for code, rank, _ in read_records(filename):
+        for k, state in enumerate(successors(decode(code))):
+            assert k < MAX_SUCCESSORS
+            yield (encode(state), rank * MAX_SUCCESSORS + k, code)
+
+
+def first_new(records, seen):
+    """Given records sorted by (code, order), yield the first record of
+    every code that is not in the seen file."""
+    old = read_records(seen, CODE)
+    old_code = next(old, (-1, ))[0]
+    last = None
+    for record in records:
+        code = record[0]
+        if code == last:
+            continue
+        last = code
+        while old_code != -1 and old_code < code:
+            old_code = next(old, (-1, ))[0]
+        if code != old_code:
+            yield record
+
+
+def merge_seen(seen, layer, directory):
+    "Add the codes of a layer file to the seen file."
+    merged = os.path.join(directory, 'seen.next')
+    write_records(merged, heapq.merge(
+        read_records(seen, CODE),
+        ((code, ) for code, _, _ in read_records(layer))), CODE)
+    os.replace(merged, seen)
+
+
+def external_sort(records, key, memory, directory):
+    """Yield records sorted by key, holding at most memory of them at a
+    time: sorted runs go to files, which are then merged, at most FAN_IN at
+    a time."""
+    runs, buffer = [], []
+    try:
+        for record in records:
+            buffer.append(record)
+            if len(buffer) >= memory:
+                runs.append(write_run(buffer, key, directory))
+                buffer = []
+        if not runs:
+            buffer.sort(key=key)
+            yield from buffer
+            return
+        if buffer:
+            runs.append(write_run(buffer, key, directory))
+        buffer = None
+        while len(runs) > FAN_IN:
+            groups = [runs[i:i + FAN_IN] for i in range(0, len(runs), FAN_IN)]
+            runs = []
+            for group in groups:
+                runs.append(new_run(directory))
+                write_records(runs[-1], heapq.merge(
+                    *[read_records(run) for run in group], key=key))
+                for run in group:
+                    os.remove(run)
+        yield from heapq.merge(*[read_records(run) for run in runs], key=key)
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def write_run(buffer, key, directory):
+    "Write the buffer sorted to a new file; return its name."
+    buffer.sort(key=key)
+    filename = new_run(directory)
+    write_records(filename, buffer)
+    return filename
+
+
+def new_run(directory):
+    "Make a new empty run file in directory; return its name."
+    handle, filename = tempfile.mkstemp(dir=directory, suffix='.run')
+    os.close(handle)
+    return filename
+
+
+def write_records(filename, records, record=RECORD):
+    "Write the records to filename; return how many there were."
+    count = 0
+    with open(filename, 'wb') as f:
+        for values in records:
+            f.write(record.pack(*values))
+            count += 1
+    return count
+
+
+def read_records(filename, record=RECORD):
+    "Yield the records of a file, reading a block at a time."
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(record.size * BLOCK)
+            if not block:
+                return
+            yield from record.iter_unpack(block)
+
+
+def find_record(data, code):
+    "Return the record for code in a mapped layer file (sorted by code)."
+    low, high = 0, len(data) // RECORD.size
+    while low < high:
+        middle = (low + high) // 2
+        record = RECORD.unpack_from(data, middle * RECORD.size)
+        if record[0] < code:
+            low = middle + 1
+        else:
+            high = middle
+    record = RECORD.unpack_from(data, low * RECORD.size)
+    assert record[0] == code
+    return record
+
+
+def follow_back(goal, layers, successors, decode):
+    """Return the path to goal = (code, parent code) in the layer after the
+    last one; the actions come from the successors of each parent."""
+    code, parent = goal
+    path = [decode(code)]
+    for filename in reversed(layers):
+        with open(filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                _, _, grandparent = find_record(data, parent)
+        state = decode(parent)
+        path += [successors(state)[path[-1]], state]
+        code, parent = parent, grandparent
+    path.reverse()
+    return path
+
+
+def mixed_radix(bases):
+    """Return encode, decode functions that number tuples whose items are
+    below bases.  Raise ValueError if there are too many such tuples for the
+    64-bit codes of the records."""
+    size = 1
+    for base in bases:
+        size *= base
+    if size > 1 << 64:
+        raise ValueError('%d states are too many for 64-bit state codes' %
+                         size)
+
+    def encode(state):
+        code = 0
+        for level, base in zip(reversed(state), reversed(bases)):
+            code = code * base + level
+        return code
+
+    def decode(code):
+        state = []
+        for base in bases:
+            code, level = divmod(code, base)
+            state.append(level)
+        return tuple(state)
+
+    return encode, decode
+
+
+def external_pour_problem(capacities, goal, start=None, memory=1000000,
+                          directory=None):
+    """more_pour_problem(capacities, goal, start), searched with at most
+    memory records in memory.  Raise ValueError if prod(c + 1) of the
+    capacities is more than 2**64, too many states to number."""
+    if start is None:
+        start = (0, ) * len(capacities)
+    if not pour_reachable(capacities, goal, start):
+        return Fail
+    encode, decode = mixed_radix([c + 1 for c in capacities])
+    return external_shortest_path_search(
+        tuple(start), more_pour_successors(capacities),
+        lambda state: goal in state, encode, decode, memory, directory)
+
+
+def external_missionaries_cannibals_problem(M=3, C=3, memory=1000000,
+                                            directory=None):
+    """missionaries_cannibals_problem((M, C, 1, 0, 0, 0)), searched with at
+    most memory records in memory; a state is numbered by the missionaries,
+    cannibals and boat on the start side only."""
+    encode3, decode3 = mixed_radix((M + 1, C + 1, 2))
+
+    def encode(state):
+        return encode3(state[:3])
+
+    def decode(code):
+        m, c, b = decode3(code)
+        return (m, c, b, M - m, C - c, 1 - b)
+
+    goal = (0, 0, 0, M, C, 1)
+    return external_shortest_path_search(
+        (M, C, 1, 0, 0, 0), missionaries_cannibals_successors,
+        lambda state: state == goal, encode, decode, memory, directory)
+
+
+def test_external_search():
+    "external memory search tests."
+    for capacities, goal in (((13, 29, 61), 60), ((1, 3, 9, 27), 13),
+                             ((4, 9), 6), ((2, 4), 3), ((3, 5, 8), 0),
+                             ((4, 9), 10)):
+        for memory in (50, 1000000):
+            assert external_pour_problem(
+                capacities, goal, memory=memory) == more_pour_problem(
+                    capacities, goal)
+    assert external_pour_problem((4, 9), 6, (1, 1),
+                                 memory=3) == more_pour_problem((4, 9), 6,
+                                                                (1, 1))
+    for M, C in ((3, 3), (2, 2), (5, 3), (4, 4)):
+        assert external_missionaries_cannibals_problem(
+            M, C, memory=5) == missionaries_cannibals_problem(
+                (M, C, 1, 0, 0, 0))
+
+    directory = tempfile.mkdtemp()
+    path = external_pour_problem((13, 29, 61, 97), 60, memory=500,
+                                 directory=directory)
+    assert path == more_pour_problem((13, 29, 61, 97), 60)
+    assert not any(name.endswith('.run') for name in os.listdir(directory))
+    shutil.rmtree(directory)
+
+    # A long thin search: 146 layers of a few states each.
+    assert external_pour_problem((97, 101), 50,
+                                 memory=30) == more_pour_problem((97, 101), 50)
+    try:
+        external_pour_problem((10**4, ) * 4 + (9999, ), 1)
+        assert False, 'expected a ValueError'
+    except ValueError:
+        pass
+    records = [(i * 7919 % 1000, i, 0) for i in range(1000)]
+    directory = tempfile.mkdtemp()
+    assert list(external_sort(iter(records), None, 3, directory)) == sorted(
+        records)
+    assert os.listdir(directory) == []
+    shutil.rmtree(directory)
+    print('test_external_search passes')
+
+
+if __name__ == '__main__':
+    test_external_search()
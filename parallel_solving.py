@@ -0,0 +1,439 @@
+'''
+Solve many independent problems at once on a pool of processes, or one
+big problem with its search spread over several processes.
+'''
+
+import array
+import bisect
+import collections
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+
+from water_pouring import (Fail, pour_problem, bridge_problem, elapsed_time,
+                           more_pour_problem, more_pour_successors,
+                           pour_reachable, bridge_successors2, bridge_goal,
+                           bridge_cost, path_cost)
+from subway_planning import boston, ride
+
+
+def solve_many(solver, instances, workers=None, chunksize=32,
+               initializer=None, initargs=()):
+    """Return [solver(*instance) for instance in instances], computed on a
+    pool of workers processes (one per CPU if None).  Instances are sent in
+    chunks of chunksize to keep the messages few; solver must be a module
+    level function.  initializer(*initargs) runs once in every worker, which
+    is the place to hand over big shared data such as a subway system."""
+    chunks = list(chunked(instances, chunksize))
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=initializer, initargs=initargs) as pool:
+        results = pool.map(solve_chunk, [solver] * len(chunks), chunks)
+        return [result for chunk in results for result in chunk]
+
+
+def solve_as_completed(solver, instances, workers=None, chunksize=32,
+                       initializer=None, initargs=()):
+    """Like solve_many, but yield (position, result) pairs as soon as each
+    chunk is done, so early answers need not wait for slow ones."""
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=initializer, initargs=initargs) as pool:
+        futures = {}
+        for start, chunk in enumerate_chunks(instances, chunksize):
+            futures[pool.submit(solve_chunk, solver, chunk)] = start
+        for future in concurrent.futures.as_completed(futures):
+            for i, result in enumerate(future.result()):
+                yield futures[future] + i, result
+
+
+def chunked(items, size):
+    "Split items into lists of at most size items."
+    items = list(items)
+    return (items[i:i + size] for i in range(0, len(items), size))
+
+
+def enumerate_chunks(items, size):
+    "Yield (position of first item, chunk) for each chunk of items."
+    for i, chunk in enumerate(chunked(items, size)):
+        yield i * size, chunk
+
+
+def solve_chunk(solver, chunk):
+    "Solve every instance of a chunk (in a worker process)."
+    return [solver(*instance) for instance in chunk]
+
+
+def pour_many(triplets, workers=None, chunksize=32):
+    "Return [pour_problem(X, Y, goal) for (X, Y, goal) in triplets]."
+    return solve_many(pour_problem, triplets, workers, chunksize)
+
+
+def bridge_many(crowds, workers=None, chunksize=4):
+    "Return [bridge_problem(here) for here in crowds]."
+    return solve_many(bridge_problem, [(here, ) for here in crowds], workers,
+                      chunksize)
+
+
+_system = None  # the subway system of a ride_many worker
+
+
+def use_system(system):
+    "Worker initializer: remember the system that rides are planned on."
+    global _system
+    _system = system
+
+
+def system_ride(here, there):
+    "Ride on the system handed to this worker by use_system."
+    return ride(here, there, _system)
+
+
+def ride_many(pairs, system=boston, workers=None, chunksize=64):
+    """Return [ride(here, there, system) for (here, there) in pairs].
+    The system is sent to each worker once, not with every chunk."""
+    return solve_many(system_ride, pairs, workers, chunksize, use_system,
+                      (system, ))
+
+
+class SearchWorkers:
+    """Processes that share the work of one search.  Worker w owns the
+    states s with hash(s) % workers == w: it keeps their parents, decides
+    which of them are new, and later expands them.  Workers send the
+    successors they make straight to the owners' inboxes, so the master
+    only starts each step and hears back how many states are new and
+    which goals were found.  States must hash the same in every worker,
+    which strings do only when the workers are forked from one process, so
+    without the fork or forkserver start method this raises RuntimeError.
+    Use it as a context manager so the processes are stopped."""
+
+    def __init__(self, successors, is_goal, action_cost=None, workers=None):
+        methods = multiprocessing.get_all_start_methods()
+        if 'fork' in methods:
+            context = multiprocessing.get_context('fork')
+        elif 'forkserver' in methods:
+            context = multiprocessing.get_context('forkserver')
+        else:  # spawned workers would each hash strings differently
+            raise RuntimeError('SearchWorkers need the fork or forkserver '
+                               'start method')
+        self.count = workers or os.cpu_count() or 1
+        self.inboxes = [context.Queue() for _ in range(self.count)]
+        self.results = context.Queue()
+        self.processes = [
+            context.Process(target=search_worker,
+                            args=(me, self.inboxes, self.results, successors,
+                                  is_goal, action_cost), daemon=True)
+            for me in range(self.count)
+        ]
+        for process in self.processes:
+            process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for inbox in self.inboxes:
+            inbox.put(('stop', ))
+        for process in self.processes:
+            process.join()
+
+    def ask(self, *message):
+        """Send message to every worker; return their answers, in worker
+        order.  An exception raised in a worker is raised again here."""
+        for inbox in self.inboxes:
+            inbox.put(message)
+        return self._answers(self.count)
+
+    def ask_one(self, worker, *message):
+        "Send message to one worker; return its answer."
+        self.inboxes[worker].put(message)
+        return self._answers(1)[worker]
+
+    def _answers(self, count):
+        answers = [None] * self.count
+        for _ in range(count):
+            worker, answer = self.results.get()
+            if isinstance(answer, Exception):
+                raise answer
+            answers[worker] = answer
+        return answers
+
+    def path(self, worker, state):
+        "Follow the parents of state, owned by worker, back to the start."
+        path = [state]
+        while True:
+            parent = self.ask_one(worker, 'parent', state)
+            if parent is None:
+                break
+            state, action, worker = parent
+            path += [action, state]
+        path.reverse()
+        return path
+
+
+def search_worker(me, inboxes, results, successors, is_goal, action_cost):
+    "The loop of one SearchWorkers process."
+    part = SearchPart(me, inboxes, successors, is_goal, action_cost)
+    while True:
+        message = inboxes[me].get()
+        if message[0] == 'stop':
+            return
+        try:
+            answer = part.receive(message)
+        except Exception as error:
+            answer = error
+        if answer is not SearchPart.BUSY:
+            results.put((me, answer))
+
+
+class SearchPart:
+    """What one worker of SearchWorkers knows: the parents of the states it
+    owns, and its share of the frontier.  receive handles one message and
+    returns the answer for the master, or BUSY while a step waits for the
+    messages of other workers.
+    Breadth-first, the frontier is a list of (position, state): the state's
+    position in the layer of the serial search.  A successor made from the
+    state at position p as successor k carries the key p * MAX_SUCCESSORS
+    + k; the smallest key that reaches a new state names its parent, and
+    the new states are numbered in order of key, which every worker can do
+    once it has the sorted keys of the others.  By cost, the frontier is
+    buckets of states by path cost, and owners keep the cheapest cost."""
+
+    BUSY = 'busy'
+    MAX_SUCCESSORS = 1 << 20
+
+    def __init__(self, me, inboxes, successors, is_goal, action_cost):
+        self.me, self.inboxes = me, inboxes
+        self.workers = len(inboxes)
+        self.successors, self.is_goal = successors, is_goal
+        self.action_cost = action_cost
+        self.parents = {}  # owned state: (parent, action, parent's owner)
+        self.costs = {}
+        self.layer = []
+        self.buckets = collections.defaultdict(list)
+        self.taken = []
+        self.reset()
+
+    def reset(self):
+        "Get ready for the next step."
+        self.expanded = False
+        self.done = 0  # workers that have sent all their successors
+        self.candidates = {}  # new state: (key, parent, action, owner)
+        self.keys = []  # the sorted keys of the other workers
+        self.new = None
+
+    def owner(self, state):
+        return hash(state) % self.workers
+
+    def receive(self, message):
+        command = message[0]
+        if command == 'start':
+            state = message[1]
+            if self.owner(state) == self.me:
+                self.parents[state] = None
+                self.costs[state] = 0
+                self.layer = [(0, state)]
+                self.buckets[0].append(state)
+            return None
+        if command == 'parent':
+            return self.parents[message[1]]
+        if command == 'expand':
+            self.expanded = True
+            self.send_successors(
+                (p * self.MAX_SUCCESSORS, state) for p, state in self.layer)
+        elif command == 'take':
+            cost = message[1]
+            self.taken = [state for state in self.buckets.pop(cost, ())
+                          if self.costs[state] == cost]
+            for state in self.taken:
+                if self.is_goal(state):
+                    return state
+            return None
+        elif command == 'expand_cost':
+            self.expanded = True
+            self.send_successors((self.costs[state], state)
+                                 for state in self.taken)
+        elif command == 'successors':
+            self.claim(message[1], message[2])
+        elif command == 'sent':
+            self.done += 1
+        elif command == 'keys':
+            self.keys.append(array.array('q', message[1]))
+        return self.step()
+
+    def send_successors(self, items):
+        """Send each owner the successors of the (base, state) items that
+        it owns, as a dict {state: (key or cost, parent, action)} that keeps
+        the smallest key or cost of each; this worker's own share is claimed
+        without a message."""
+        parts = [{} for _ in range(self.workers)]
+        workers, action_cost = self.workers, self.action_cost
+        for base, state in items:
+            for k, (child, action) in enumerate(
+                    self.successors(state).items()):
+                if action_cost is None:
+                    value = base + k
+                else:
+                    value = base + action_cost(action)
+                    action = (action, value)
+                part = parts[hash(child) % workers]
+                old = part.get(child)
+                if old is None or value < old[0]:
+                    part[child] = (value, state, action)
+        for w, (inbox, part) in enumerate(zip(self.inboxes, parts)):
+            if w == self.me:
+                self.claim(w, part)
+                self.done += 1
+            else:
+                inbox.put(('successors', self.me, part))
+                inbox.put(('sent', ))
+
+    def claim(self, sender, entries):
+        """Keep the entries from worker sender that reach an owned state
+        first or more cheaply."""
+        parents = self.parents
+        if self.action_cost is not None:
+            costs = self.costs
+            for child, (cost, parent, action) in entries.items():
+                if cost < costs.get(child, cost + 1):
+                    costs[child] = cost
+                    parents[child] = (parent, action, sender)
+                    self.buckets[cost].append(child)
+            return
+        candidates = self.candidates
+        for child, (key, parent, action) in entries.items():
+            if child not in parents:
+                old = candidates.get(child)
+                if old is None or key < old[0]:
+                    candidates[child] = (key, parent, action, sender)
+
+    def step(self):
+        "Finish the step if every worker's messages are in; else BUSY."
+        if not self.expanded or self.done < self.workers:
+            return self.BUSY
+        if self.action_cost is not None:
+            self.reset()
+            return min((cost for cost, states in self.buckets.items()
+                        if states), default=None)
+        if self.new is None:
+            self.new = sorted((key, child) for child, (key, _, _, _)
+                              in self.candidates.items())
+            keys = array.array('q', [key for key, _ in self.new]).tobytes()
+            for w, inbox in enumerate(self.inboxes):
+                if w != self.me:
+                    inbox.put(('keys', keys))
+        if len(self.keys) < self.workers - 1:
+            return self.BUSY
+        goal, layer = None, []
+        for i, (key, child) in enumerate(self.new):
+            _, parent, action, owner = self.candidates[child]
+            self.parents[child] = (parent, action, owner)
+            if goal is None and self.is_goal(child):
+                goal = (key, child)
+            layer.append((i + sum(bisect.bisect_left(keys, key)
+                                  for keys in self.keys), child))
+        self.layer = layer
+        count = len(layer)
+        self.reset()
+        return count, goal
+
+
+def parallel_shortest_path_search(start, successors, is_goal, workers=None):
+    """Find the same shortest path as shortest_path_search, a layer at a
+    time, with SearchWorkers expanding the layer and deciding which of its
+    successors are new.  successors and is_goal must be picklable (module
+    level functions, or functools.partial of them)."""
+    if is_goal(start):
+        return [start]
+    with SearchWorkers(successors, is_goal, None, workers) as pool:
+        pool.ask('start', start)
+        while True:
+            answers = pool.ask('expand')
+            goals = [(goal, w) for w, (_, goal) in enumerate(answers)
+                     if goal is not None]
+            if goals:
+                (_, state), worker = min(goals)
+                return pool.path(worker, state)
+            if not any(count for count, _ in answers):
+                return Fail
+
+
+def parallel_lowest_cost_search(start, successors, is_goal, action_cost,
+                                workers=None):
+    """Find a path of the same lowest cost as lowest_cost_search (ties may
+    be broken differently).  Each worker keeps the states it owns in
+    buckets by path cost; all the states of the cheapest bucket, whose
+    costs are final, are expanded at once.  successors, is_goal and
+    action_cost must be picklable."""
+    with SearchWorkers(successors, is_goal, action_cost, workers) as pool:
+        pool.ask('start', start)
+        cost = 0
+        while cost is not None:
+            goals = pool.ask('take', cost)
+            for worker, state in enumerate(goals):
+                if state is not None:
+                    return pool.path(worker, state)
+            cost = min((cost for cost in pool.ask('expand_cost')
+                        if cost is not None), default=None)
+    return Fail
+
+
+def holds(goal, state):
+    "Does some glass of state hold goal?"
+    return goal in state
+
+
+def pour_successors(capacities, state):
+    "more_pour_successors(capacities)(state), as a picklable function."
+    return more_pour_successors(capacities)(state)
+
+
+def parallel_pour_problem(capacities, goal, start=None, workers=None):
+    "more_pour_problem(capacities, goal, start), searched on workers."
+    if start is None:
+        start = (0, ) * len(capacities)
+    if not pour_reachable(capacities, goal, start):
+        return Fail
+    return parallel_shortest_path_search(
+        start, functools.partial(pour_successors, tuple(capacities)),
+        functools.partial(holds, goal), workers)
+
+
+def parallel_bridge_problem(here, workers=None):
+    "A fastest path across the bridge, like bridge_problem, on workers."
+    start = (frozenset(here) | frozenset(['light']), frozenset())
+    return parallel_lowest_cost_search(start, bridge_successors2, bridge_goal,
+                                       bridge_cost, workers)
+
+
+def test_parallel_solving():
+    "parallel solving tests."
+    triplets = [(X, Y, goal) for X in range(1, 6) for Y in range(1, 6)
+                for goal in range(1, 6)]
+    assert pour_many(triplets, workers=2, chunksize=7) == [
+        pour_problem(*triplet) for triplet in triplets
+    ]
+    crowds = [[1, 2, 5, 10], [1, 2, 4, 8, 16], [3, 4]]
+    assert [elapsed_time(path) for path in bridge_many(crowds, workers=2)
+            ] == [17, 28, 4]
+    pairs = [('mit', 'government'), ('newton', 'alewife'), ('mit', 'mit')]
+    assert ride_many(pairs, workers=2, chunksize=1) == [
+        ride(here, there) for here, there in pairs
+    ]
+    results = dict(
+        solve_as_completed(pour_problem, triplets, workers=2, chunksize=10))
+    assert [results[i] for i in range(len(triplets))
+            ] == [pour_problem(*triplet) for triplet in triplets]
+    for capacities, goal in (((13, 29, 61), 60), ((1, 3, 9, 27), 13),
+                             ((4, 9), 6), ((4, 9), 10), ((2, 4), 3)):
+        assert parallel_pour_problem(capacities, goal,
+                                     workers=3) == more_pour_problem(
+                                         capacities, goal)
+    assert parallel_pour_problem((4, 9), 0, workers=2) == [(0, 0)]
+    for here in ([1, 2, 5, 10], [1, 2, 4, 8, 16], [3, 4], []):
+        path = parallel_bridge_problem(here, workers=2)
+        assert path_cost(path) == path_cost(bridge_problem(here))
+    print('test_parallel_solving passes')
+
+
+if __name__ == '__main__':
+    test_parallel_solving()
@@ -0,0 +1,150 @@
+'''
+Remember solutions to pouring and bridge problems, in memory and on disk.
+'''
+
+import collections
+import os
+import pickle
+import sqlite3
+import tempfile
+
+from water_pouring import (pour_problem, more_pour_problem,
+                           more_pour_successors, bridge_problem)
+
+# How pour_problem actions read when the two glasses trade places.
+SWAPPED_POUR_ACTIONS = {
+    'X->Y': 'X<-Y',
+    'X<-Y': 'X->Y',
+    'fill X': 'fill Y',
+    'fill Y': 'fill X',
+    'empty X': 'empty Y',
+    'empty Y': 'empty X'
+}
+
+
+class SolutionCache:
+    """Solutions keyed by a canonical signature of their problem, so that
+    problems that differ only in the order of glasses or people share one
+    entry.  The maxsize most recently used are kept in memory; if filename
+    is given, all of them are also kept in an sqlite file there, which
+    outlives the process."""
+
+    def __init__(self, filename=None, maxsize=1024):
+        self.maxsize = maxsize
+        self.memory = collections.OrderedDict()
+        self.db = None
+        if filename is not None:
+            self.db = sqlite3.connect(filename)
+            self.db.execute('CREATE TABLE IF NOT EXISTS solutions '
+                            '(problem TEXT PRIMARY KEY, solution BLOB)')
+            self.db.commit()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def solve(self, signature, solver, *args):
+        """Return the solution for signature, calling solver(*args) to find
+        it if it is not remembered.  Callers get a copy of the remembered
+        path, so changing it leaves the cache alone."""
+        key = repr(signature)
+        if key in self.memory:
+            self.hits += 1
+            self.memory.move_to_end(key)
+            return list(self.memory[key])
+        row = None
+        if self.db is not None:
+            row = self.db.execute(
+                'SELECT solution FROM solutions WHERE problem = ?',
+                (key, )).fetchone()
+        if row is not None:
+            self.disk_hits += 1
+            solution = pickle.loads(row[0])
+        else:
+            self.misses += 1
+            solution = solver(*args)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO solutions VALUES (?, ?)',
+                    (key, pickle.dumps(solution)))
+                self.db.commit()
+        self.memory[key] = solution
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+        return list(solution)
+
+    def pour_problem(self, X, Y, goal, start=(0, 0)):
+        "pour_problem(X, Y, goal, start), with the smaller glass first."
+        if X <= Y:
+            return self.solve(('pour', X, Y, goal, tuple(start)),
+                              pour_problem, X, Y, goal, tuple(start))
+        path = self.pour_problem(Y, X, goal, (start[1], start[0]))
+        return [
+            SWAPPED_POUR_ACTIONS[step] if i % 2 else (step[1], step[0])
+            for i, step in enumerate(path)
+        ]
+
+    def more_pour_problem(self, capacities, goal, start=None):
+        """more_pour_problem(capacities, goal, start), solved with the glasses
+        in order of capacity and mapped back to the caller's order."""
+        if start is None:
+            start = (0, ) * len(capacities)
+        order = sorted(range(len(capacities)), key=lambda i: capacities[i])
+        sorted_capacities = tuple(capacities[i] for i in order)
+        sorted_start = tuple(start[i] for i in order)
+        path = self.solve(('more_pour', sorted_capacities, goal, sorted_start),
+                          more_pour_problem, sorted_capacities, goal,
+                          sorted_start)
+        result = []
+        for i, step in enumerate(path):
+            if i % 2:
+                result.append((step[0], ) + tuple(order[j] for j in step[1:]))
+            else:
+                state = [0] * len(step)
+                for j, level in zip(order, step):
+                    state[j] = level
+                result.append(tuple(state))
+        return result
+
+    def bridge_problem(self, here):
+        "bridge_problem(here); the order of the people does not matter."
+        here = sorted(here)
+        return self.solve(('bridge', tuple(here)), bridge_problem, here)
+
+    def close(self):
+        "Close the file; the memory cache stays usable."
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def test_solution_cache():
+    "solution cache tests."
+    filename = os.path.join(tempfile.mkdtemp(), 'solutions.sqlite')
+    cache = SolutionCache(filename, maxsize=2)
+    assert cache.pour_problem(4, 9, 6) == pour_problem(4, 9, 6)
+    swapped = cache.pour_problem(9, 4, 6)
+    assert len(swapped) == len(pour_problem(9, 4, 6))
+    assert swapped[-1] == (6, 4) and swapped[1] == 'fill X'
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.pour_problem(4, 9, 6).append('junk')
+    assert cache.pour_problem(4, 9, 6) == pour_problem(4, 9, 6)
+
+    for capacities in ((9, 1, 3), (3, 9, 1), (1, 3, 9)):
+        path = cache.more_pour_problem(capacities, 5)
+        assert path[0] == (0, 0, 0) and 5 in path[-1]
+        assert len(path) == len(more_pour_problem(capacities, 5))
+        successors = more_pour_successors(capacities)
+        for state, action, state2 in zip(path[0::2], path[1::2], path[2::2]):
+            assert successors(state)[state2] == action
+    assert cache.bridge_problem([10, 5, 2, 1]) == bridge_problem([1, 2, 5, 10])
+    assert len(cache.memory) == 2 and cache.misses == 3
+    cache.close()
+
+    cache = SolutionCache(filename)
+    assert cache.pour_problem(4, 9, 6) == pour_problem(4, 9, 6)
+    assert (cache.disk_hits, cache.misses) == (1, 0)
+    cache.close()
+    os.remove(filename)
+    print('test_solution_cache passes')
+
+
+if __name__ == '__main__':
+    test_solution_cache()
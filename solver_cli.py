@@ -0,0 +1,346 @@
+'''
+Answer many problems from the command line: one JSON problem per input
+line, one JSON answer per output line, as soon as each is solved.
+
+    python solver_cli.py solve problems.jsonl
+    echo '{"problem": "pour", "X": 4, "Y": 9, "goal": 6}' | python solver_cli.py solve
+
+Problems are {"problem": kind, ...arguments}, where kind is one of
+    pour          X, Y, goal[, start]
+    more_pour     capacities, goal[, start]
+    bridge        here
+    missionaries  M, C[, boat]
+    ride          here, there       (on the Boston subway)
+and the answer is {"line": input line number, "path": path}, or
+{"line": ..., "error": message}.  Prebuilt tables answer without a search:
+
+    python solver_cli.py build-pour 100 pour.table
+    python solver_cli.py build-rides rides.table
+    python solver_cli.py solve --pour-table pour.table --ride-table rides.table
+
+and "python solver_cli.py test" runs the tests.
+'''
+
+import argparse
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from water_pouring import (Fail, pour_problem, pour_problem_table,
+                           more_pour_problem, bridge_problem,
+                           general_missionaries_cannibals)
+from subway_planning import boston, ride, RouteIndex
+
+POUR_ACTIONS = ('X->Y', 'X<-Y', 'fill X', 'fill Y', 'empty X', 'empty Y')
+NO_PATH = 255  # the action byte of an unreachable goal
+
+
+class PourTable:
+    """pour_problem(X, Y, goal) for every X, Y and goal below size, read
+    from a file written by build_pour_table, which is mapped into memory
+    rather than read, so opening it costs nothing and a lookup only touches
+    the pages it needs.  Paths are kept as their action numbers (see
+    POUR_ACTIONS), found from offsets[(X * size + Y) * size + goal]."""
+
+    MAGIC = b'POURTAB1'
+    HEADER = struct.Struct('<8sI')
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = self.HEADER.unpack_from(self.data)
+        if magic != self.MAGIC:
+            raise ValueError('%s is not a pour table' % filename)
+        self.actions = self.HEADER.size + 4 * (self.size**3 + 1)
+
+    def pour_problem(self, X, Y, goal):
+        "Return pour_problem(X, Y, goal), or None if it is not in the table."
+        if not (0 <= X < self.size and 0 <= Y < self.size and
+                0 <= goal < self.size):
+            return None
+        start, end = struct.unpack_from(
+            '<2I', self.data,
+            self.HEADER.size + 4 * ((X * self.size + Y) * self.size + goal))
+        moves = self.data[self.actions + start:self.actions + end]
+        if moves == bytes([NO_PATH]):
+            return Fail
+        x = y = 0
+        path = [(0, 0)]
+        for a in moves:
+            if a == 0:
+                x, y = x - min(x, Y - y), y + min(x, Y - y)
+            elif a == 1:
+                x, y = x + min(y, X - x), y - min(y, X - x)
+            elif a == 2:
+                x = X
+            elif a == 3:
+                y = Y
+            elif a == 4:
+                x = 0
+            else:
+                y = 0
+            path += [POUR_ACTIONS[a], (x, y)]
+        return path
+
+    def close(self):
+        self.data.close()
+
+
+def build_pour_table(size, filename):
+    "Write a PourTable of every pour_problem with X, Y, goal < size."
+    numbers = dict((action, i) for i, action in enumerate(POUR_ACTIONS))
+    offsets, moves = [0], bytearray()
+    for X in range(size):
+        for Y in range(size):
+            table = pour_problem_table(X, Y)
+            for goal in range(size):
+                path = table.get(goal, Fail)
+                if path:
+                    moves.extend(numbers[action] for action in path[1::2])
+                else:
+                    moves.append(NO_PATH)
+                offsets.append(len(moves))
+    with open(filename, 'wb') as f:
+        f.write(PourTable.HEADER.pack(PourTable.MAGIC, size))
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(moves)
+
+
+class RideTable:
+    """The shortest ride between every pair of stations of a subway system,
+    from a file written by build_ride_table and mapped into memory.  For
+    stations numbered a and b, item a * n + b of the parents array is the
+    station before b on the ride from a (-1 if none), and the same item of
+    the tracks array the number of the line that runs from it to b."""
+
+    MAGIC = b'RIDETAB1'
+    HEADER = struct.Struct('<8s3I')
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, n_lines, size = self.HEADER.unpack_from(self.data)
+        if magic != self.MAGIC:
+            raise ValueError('%s is not a ride table' % filename)
+        position = self.HEADER.size
+        names = self.data[position:position + size].decode('utf-8')
+        names = names.split('\n')
+        self.stations, self.lines = names[:n], names[n:n + n_lines]
+        self.index = dict((s, i) for i, s in enumerate(self.stations))
+        self.parents = position + size
+        self.tracks = self.parents + 4 * n * n
+
+    def ride(self, here, there):
+        """Return the shortest path from here to there, or None if either
+        station is not in the table."""
+        if here not in self.index or there not in self.index:
+            return None
+        n, a, b = len(self.stations), self.index[here], self.index[there]
+        path = [there]
+        while b != a:
+            parent, = struct.unpack_from('<i', self.data,
+                                         self.parents + 4 * (a * n + b))
+            if parent == -1:
+                return Fail
+            line, = struct.unpack_from('<h', self.data,
+                                       self.tracks + 2 * (a * n + b))
+            b = parent
+            path += [self.lines[line], self.stations[b]]
+        path.reverse()
+        return path
+
+    def close(self):
+        self.data.close()
+
+
+def build_ride_table(filename, system=boston):
+    "Write a RideTable of every ride on system."
+    index = RouteIndex(system)
+    n = len(index.stations)
+    lines = sorted(set(line for neighbors in system.values()
+                       for line in neighbors.values()))
+    line_numbers = dict((line, i) for i, line in enumerate(lines))
+    tracks = []
+    for a in range(n):
+        for b in range(n):
+            parent = index.parents[a * n + b]
+            tracks.append(-1 if parent == -1 else line_numbers[system[
+                index.stations[parent]][index.stations[b]]])
+    names = '\n'.join(index.stations + lines).encode('utf-8')
+    with open(filename, 'wb') as f:
+        f.write(RideTable.HEADER.pack(RideTable.MAGIC, n, len(lines),
+                                      len(names)))
+        f.write(names)
+        f.write(struct.pack('<%di' % (n * n), *index.parents))
+        f.write(struct.pack('<%dh' % (n * n), *tracks))
+
+
+def solve_problem(problem, pour_table=None, ride_table=None):
+    "Return the path that answers one problem dict."
+    kind = problem['problem']
+    if kind == 'pour':
+        start = tuple(problem.get('start', (0, 0)))
+        check_levels(start, (problem['X'], problem['Y']))
+        if pour_table is not None and start == (0, 0):
+            path = pour_table.pour_problem(problem['X'], problem['Y'],
+                                           problem['goal'])
+            if path is not None:
+                return path
+        return pour_problem(problem['X'], problem['Y'], problem['goal'], start)
+    if kind == 'more_pour':
+        start = problem.get('start')
+        if start is not None:
+            check_levels(start, problem['capacities'])
+        return more_pour_problem(tuple(problem['capacities']), problem['goal'],
+                                 start and tuple(start))
+    if kind == 'bridge':
+        return bridge_problem(problem['here'])
+    if kind == 'missionaries':
+        return general_missionaries_cannibals(problem['M'], problem['C'],
+                                              problem.get('boat', 2))
+    if kind == 'ride':
+        for station in (problem['here'], problem['there']):
+            if station not in boston:
+                raise KeyError(station)
+        if ride_table is not None:
+            path = ride_table.ride(problem['here'], problem['there'])
+            if path is not None:
+                return path
+        return ride(problem['here'], problem['there'])
+    raise ValueError('unknown problem %r' % kind)
+
+
+def check_levels(levels, capacities):
+    "Raise ValueError unless levels are possible in glasses of capacities."
+    if len(levels) != len(capacities) or not all(
+            0 <= level <= capacity
+            for level, capacity in zip(levels, capacities)):
+        raise ValueError('start %r does not fit glasses of %r' %
+                         (list(levels), list(capacities)))
+
+
+def plain(value):
+    "Turn a path into something json can write: frozensets become lists."
+    if isinstance(value, (frozenset, set)):
+        return sorted((plain(item) for item in value), key=repr)
+    if isinstance(value, (tuple, list)):
+        return [plain(item) for item in value]
+    return value
+
+
+def solve_lines(lines, out, pour_table=None, ride_table=None):
+    "Answer each JSON problem line, writing one JSON answer line for each."
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            answer = {'line': number, 'path': plain(solve_problem(
+                json.loads(line), pour_table, ride_table))}
+        except Exception as error:  # one bad problem must not stop the rest
+            answer = {'line': number, 'error': '%s: %s' % (
+                type(error).__name__, error)}
+        out.write(json.dumps(answer) + '\n')
+        out.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command')
+    solve = commands.add_parser('solve', help='answer JSON problem lines')
+    solve.add_argument('input', nargs='?', default='-',
+                       help='file of problems, one per line (default stdin)')
+    solve.add_argument('--pour-table', metavar='FILE')
+    solve.add_argument('--ride-table', metavar='FILE')
+    build_pour = commands.add_parser('build-pour',
+                                     help='write a table of pour problems')
+    build_pour.add_argument('size', type=int,
+                            help='table X, Y and goal below this')
+    build_pour.add_argument('output')
+    build_rides = commands.add_parser(
+        'build-rides', help='write a table of all Boston subway rides')
+    build_rides.add_argument('output')
+    commands.add_parser('test', help='run the tests of this module')
+    args = parser.parse_args(argv)
+
+    if args.command == 'test':
+        test_solver_cli()
+    elif args.command == 'build-pour':
+        build_pour_table(args.size, args.output)
+    elif args.command == 'build-rides':
+        build_ride_table(args.output)
+    elif args.command == 'solve':
+        pour_table = args.pour_table and PourTable(args.pour_table)
+        ride_table = args.ride_table and RideTable(args.ride_table)
+        if args.input == '-':
+            solve_lines(sys.stdin, sys.stdout, pour_table, ride_table)
+        else:
+            with open(args.input) as lines:
+                solve_lines(lines, sys.stdout, pour_table, ride_table)
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+def test_solver_cli():
+    "solver command line tests."
+    directory = tempfile.mkdtemp()
+    pour_file = os.path.join(directory, 'pour.table')
+    ride_file = os.path.join(directory, 'rides.table')
+    main(['build-pour', '12', pour_file])
+    main(['build-rides', ride_file])
+    pour_table, ride_table = PourTable(pour_file), RideTable(ride_file)
+    for X in range(12):
+        for Y in range(12):
+            for goal in range(12):
+                assert pour_table.pour_problem(X, Y, goal) == pour_problem(
+                    X, Y, goal)
+    assert pour_table.pour_problem(4, 9, 12) is None
+    for here in ('mit', 'wonderland', 'mattapan'):
+        for there in boston:
+            assert len(ride_table.ride(here, there)) == len(ride(here, there))
+    assert ride_table.ride('mit', 'mit') == ['mit']
+    assert ride_table.ride('mit', 'nowhere') is None
+
+    problems = [
+        {'problem': 'pour', 'X': 4, 'Y': 9, 'goal': 6},
+        {'problem': 'pour', 'X': 40, 'Y': 90, 'goal': 60},
+        {'problem': 'more_pour', 'capacities': [1, 2, 4], 'goal': 3},
+        {'problem': 'bridge', 'here': [1, 2, 5, 10]},
+        {'problem': 'missionaries', 'M': 4, 'C': 4, 'boat': 3},
+        {'problem': 'ride', 'here': 'mit', 'there': 'government'},
+        {'problem': 'ride', 'here': 'mit', 'there': 'nowhere'},
+        {'problem': 'teleport'},
+        {'problem': 'pour', 'X': 4, 'Y': 9, 'goal': 6, 'start': [5, 0]},
+        {'problem': 'pour', 'X': 4, 'Y': 9, 'goal': 6, 'start': [4, 0]},
+    ]
+    out = io.StringIO()
+    solve_lines([json.dumps(problem) for problem in problems] + ['', '{'],
+                out, pour_table, ride_table)
+    answers = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [answer['line'] for answer in answers] == [1, 2, 3, 4, 5, 6, 7, 8,
+                                                      9, 10, 12]
+    assert answers[0]['path'] == plain(pour_problem(4, 9, 6))
+    assert answers[1]['path'] == plain(pour_problem(40, 90, 60))
+    assert answers[2]['path'] == [[0, 0, 0], ['fill', 2], [0, 0, 4],
+                                  ['pour', 2, 0], [1, 0, 3]]
+    assert answers[3]['path'] == plain(bridge_problem([1, 2, 5, 10]))
+    assert answers[4]['path'][-1] == [0, 0, 0, 4, 4, 1]
+    assert answers[5]['path'] == ride('mit', 'government')
+    assert 'error' in answers[6] and 'error' in answers[7]
+    assert answers[8]['error'].startswith('ValueError: start [5, 0]')
+    assert answers[9]['path'] == plain(pour_problem(4, 9, 6, (4, 0)))
+    assert 'error' in answers[10]
+    pour_table.close()
+    ride_table.close()
+    for filename in (pour_file, ride_file):
+        os.remove(filename)
+    print('test_solver_cli passes')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
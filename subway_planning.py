@@ -1,8 +1,16 @@
 '''
 Subway planning.
 '''
+import array
+import bisect
 import collections
-from water_pouring import shortest_path_search, path_states, path_actions
+import os
+import random
+import struct
+import sys
+import tempfile
+from water_pouring import (bidirectional_search, lowest_cost_search,
+                           path_states, path_actions, INFINITY)
 
 # Write a function, subway, that takes lines as input (read more about
 # the **lines notation in the instructor comments box below) and returns
@@ -51,6 +59,26 @@ boston = subway(
 )
 
 
+def synthetic_subway(stations, lines, seed=0):
+    """Make up a connected subway system with about this many stations on
+    this many lines, for testing and benchmarks.  Each line runs through its
+    own share of new stations and starts and ends at stations of earlier
+    lines, where riders can change."""
+    rng = random.Random(seed)
+    names = ['s%d' % i for i in range(stations)]
+    share = max(len(names) // lines, 1)
+    routes = {}
+    for k in range(lines):
+        route = names[k * share:(k + 1) * share]
+        if k == lines - 1:
+            route = names[k * share:]
+        if k:
+            earlier = names[:k * share]
+            route = [rng.choice(earlier)] + route + [rng.choice(earlier)]
+        routes['line%d' % k] = ' '.join(route)
+    return subway(**routes)
+
+
 def is_goal(dest):
     def _f(value):
         return value == dest
@@ -66,16 +94,397 @@ def successors(system):
 
 
 def ride(here, there, system=boston):
-    "Return a path on the subway system from here to there."
-    return shortest_path_search(here, successors(system), is_goal(there))
+    """Return a path on the subway system from here to there.
+    Every track runs both ways, so search from both ends at once."""
+    return bidirectional_search(here, there, successors(system))
+
+
+def timed_ride(here, there, system=boston, travel_time=None, transfer=0):
+    """Return the quickest path on the subway system from here to there, as
+    [station, line, station, ...], where riding from a to b takes
+    travel_time[a, b] or travel_time[b, a] (1 if neither is given) and
+    every change of line takes transfer more.  A state of the search is
+    (station, line we are on), so changes can be charged for."""
+    times = travel_time or {}
+
+    def ride_successors(state):
+        station, line = state
+        result = {}
+        for neighbor, next_line in system[station].items():
+            time = times.get((station, neighbor),
+                             times.get((neighbor, station), 1))
+            if line is not None and next_line != line:
+                time += transfer
+            result[(neighbor, next_line)] = (next_line, time)
+        return result
+
+    def arrived(state):
+        return state[0] == there
+
+    def minutes(action):
+        return action[1]
+
+    path = lowest_cost_search((here, None), ride_successors, arrived, minutes)
+    if not path:
+        return path
+    result = [here]
+    for ((line, _), _), (station, _) in zip(path[1::2], path[2::2]):
+        result += [line, station]
+    return result
 
 
 def longest_ride(system):
     """"Return the longest possible 'shortest path'
     ride between any two stops in the system."""
-    stations = set(system.keys())
-    return max(
-        [ride(a, b) for a in stations for b in stations if a != b], key=len)
+    return route_index(system).longest_ride()
+
+
+class RouteIndex:
+    """The shortest ride between every pair of stations of a subway system,
+    from one breadth-first tree per station.  Stations are numbered in the
+    order of the system dict; parents[a * n + b] is the number of the
+    station before b on the ride from a, or -1 if b is a or unreachable."""
+
+    def __init__(self, system):
+        self.system = system
+        self.stations = list(system)
+        self.index = dict((s, i) for i, s in enumerate(self.stations))
+        n = len(self.stations)
+        neighbors = [[self.index[s] for s in system[station]]
+                     for station in self.stations]
+        self.parents = array.array('i', [-1]) * (n * n)
+        self.farthest = []  # (hops, station) farthest from each station
+        for a in range(n):
+            self.farthest.append(self._grow_tree(a, neighbors))
+
+    def _grow_tree(self, a, neighbors):
+        "Fill in the breadth-first tree from a; return its deepest station."
+        n = len(self.stations)
+        parents, base = self.parents, a * n
+        depth = {a: 0}
+        frontier = collections.deque([a])
+        last = a
+        while frontier:
+            last = frontier.popleft()
+            for b in neighbors[last]:
+                if b not in depth:
+                    depth[b] = depth[last] + 1
+                    parents[base + b] = last
+                    frontier.append(b)
+        return depth[last], last
+
+    def ride(self, here, there):
+        "Return the shortest path from here to there, or Fail."
+        n = len(self.stations)
+        a, b = self.index[here], self.index[there]
+        if a != b and self.parents[a * n + b] == -1:
+            return []
+        path = [b]
+        while path[-1] != a:
+            path.append(self.parents[a * n + path[-1]])
+        path.reverse()
+        return self._station_path(path)
+
+    def longest_ride(self):
+        "Return the longest of all the shortest rides."
+        a = max(range(len(self.stations)), key=lambda a: self.farthest[a][0])
+        return self.ride(self.stations[a], self.stations[self.farthest[a][1]])
+
+    def _station_path(self, numbers):
+        "Turn a list of station numbers into a [station, line, ...] path."
+        stations = [self.stations[i] for i in numbers]
+        path = stations[:1]
+        for a, b in zip(stations, stations[1:]):
+            path.append(self.system[a][b])
+            path.append(b)
+        return path
+
+
+_route_indexes = collections.OrderedDict()  # id(system): RouteIndex
+ROUTE_INDEXES = 8  # most systems whose RouteIndex is kept
+
+
+def route_index(system):
+    """Return the RouteIndex of system, building it the first time.  Only
+    the ROUTE_INDEXES most recently used are kept.  Whoever changes the
+    stations, tracks or lines of a system in place must call
+    invalidate_route_index(system) (DynamicRouteIndex does)."""
+    index = _route_indexes.get(id(system))
+    if index is None or index.system is not system:
+        index = _route_indexes[id(system)] = RouteIndex(system)
+        if len(_route_indexes) > ROUTE_INDEXES:
+            _route_indexes.popitem(last=False)
+    _route_indexes.move_to_end(id(system))
+    return index
+
+
+def invalidate_route_index(system):
+    "Forget the RouteIndex of system, which has changed."
+    index = _route_indexes.get(id(system))
+    if index is not None and index.system is system:
+        del _route_indexes[id(system)]
+
+
+def clear_route_indexes():
+    "Forget every cached RouteIndex."
+    _route_indexes.clear()
+
+
+class DynamicRouteIndex:
+    """Shortest rides on a subway system that changes: tracks, stations and
+    whole lines can be added and removed (changing the system dict in
+    place), and the kept breadth-first trees are mended rather than grown
+    again.  A new track that makes rides shorter hangs the stations it
+    brings closer on its near end; a removed track that a tree used is
+    replaced by another one from the same depth if there is one.  Only a
+    tree that cannot be mended is thrown away, to be grown again when a
+    ride from its station is asked for."""
+
+    def __init__(self, system):
+        self.system = system
+        self.trees = {}  # station: [depth, parents, (hops, farthest)]
+        self.trees_grown = 0
+
+    def tree(self, here):
+        "The breadth-first tree from here, grown if it is not kept."
+        tree = self.trees.get(here)
+        if tree is None:
+            depth, parents = {here: 0}, {here: None}
+            frontier = collections.deque([here])
+            last = here
+            while frontier:
+                last = frontier.popleft()
+                for station in self.system[last]:
+                    if station not in depth:
+                        depth[station] = depth[last] + 1
+                        parents[station] = last
+                        frontier.append(station)
+            tree = self.trees[here] = [depth, parents, (depth[last], last)]
+            self.trees_grown += 1
+        return tree
+
+    def ride(self, here, there):
+        "Return a shortest path from here to there, or Fail."
+        for station in (here, there):
+            if station not in self.system:
+                raise KeyError(station)
+        parents = self.tree(here)[1]
+        if there not in parents:
+            return []
+        stations = [there]
+        while stations[-1] != here:
+            stations.append(parents[stations[-1]])
+        stations.reverse()
+        path = stations[:1]
+        for a, b in zip(stations, stations[1:]):
+            path.append(self.system[a][b])
+            path.append(b)
+        return path
+
+    def longest_ride(self):
+        "Return the longest of all the shortest rides."
+        here = max(self.system, key=lambda here: self.tree(here)[2][0])
+        return self.ride(here, self.trees[here][2][1])
+
+    def add_track(self, a, b, line):
+        "Join stations a and b (added if new) on line."
+        for station in (a, b):
+            if station not in self.system:
+                self.add_station(station)
+        self.system[a][b] = self.system[b][a] = line
+        invalidate_route_index(self.system)
+        for tree in self.trees.values():
+            depth = tree[0]
+            near, far = (a, b) if depth.get(a, INFINITY) < depth.get(
+                b, INFINITY) else (b, a)
+            if near in depth and depth.get(far, INFINITY) > depth[near] + 1:
+                self._shorten(tree, near, far)
+
+    def _shorten(self, tree, near, far):
+        "Reach far (and whatever it brings closer) from near in the tree."
+        depth, parents, _ = tree
+        depth[far], parents[far] = depth[near] + 1, near
+        frontier = collections.deque([far])
+        while frontier:
+            last = frontier.popleft()
+            for station in self.system[last]:
+                if depth.get(station, INFINITY) > depth[last] + 1:
+                    depth[station], parents[station] = depth[last] + 1, last
+                    frontier.append(station)
+        farthest = max(depth, key=depth.get)
+        tree[2] = (depth[farthest], farthest)
+
+    def remove_track(self, a, b):
+        "Take away the track between stations a and b."
+        del self.system[a][b], self.system[b][a]
+        invalidate_route_index(self.system)
+        for here, (depth, parents, _) in list(self.trees.items()):
+            for child, parent in ((b, a), (a, b)):
+                if parents.get(child) == parent and not self._reattach(
+                        depth, parents, child):
+                    del self.trees[here]
+                    break
+
+    def _reattach(self, depth, parents, station):
+        """Give station another parent at the same depth as its old one;
+        return False if it has none."""
+        for neighbor in self.system[station]:
+            if depth.get(neighbor) == depth[station] - 1:
+                parents[station] = neighbor
+                return True
+        return False
+
+    def add_station(self, station, neighbors=None):
+        "Add station, with tracks to its {neighbor: line, ...} if given."
+        if station not in self.system:
+            self.system[station] = {}
+            invalidate_route_index(self.system)
+        for neighbor, line in (neighbors or {}).items():
+            self.add_track(station, neighbor, line)
+
+    def remove_station(self, station):
+        """Close station and every track to it.  Trees that reached it are
+        mended if every station hung on it can hang on another one."""
+        neighbors = self.system.pop(station)
+        for neighbor in neighbors:
+            del self.system[neighbor][station]
+        invalidate_route_index(self.system)
+        self.trees.pop(station, None)
+        for here, (depth, parents, farthest) in list(self.trees.items()):
+            if station not in depth:
+                continue
+            if farthest[1] == station or not all(
+                    self._reattach(depth, parents, neighbor)
+                    for neighbor in neighbors
+                    if parents[neighbor] == station):
+                del self.trees[here]
+            else:
+                del depth[station], parents[station]
+
+    def add_line(self, line, stations):
+        "Add a line through stations, given as in subway(line=stations)."
+        stations = stations.split()
+        for a, b in zip(stations, stations[1:]):
+            self.add_track(a, b, line)
+
+    def remove_line(self, line):
+        "Take away every track of line (but not the stations)."
+        for a in list(self.system):
+            for b, track_line in list(self.system[a].items()):
+                if track_line == line:
+                    self.remove_track(a, b)
+
+
+class CompiledSystem:
+    """A subway system with stations and lines numbered, its tracks in
+    compressed sparse rows: the neighbors of station i are
+    neighbors[offsets[i]:offsets[i + 1]], reached on the lines numbered in
+    the same places of line_ids.  Searches run on numbers only; names come
+    back just in the returned path."""
+
+    MAGIC = b'SUBWAY1\0'
+    HEADER = struct.Struct('<8s4I')
+
+    def __init__(self, stations, lines, offsets, neighbors, line_ids):
+        self.stations = stations
+        self.lines = lines
+        self.index = dict((s, i) for i, s in enumerate(stations))
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.line_ids = line_ids
+
+    @classmethod
+    def from_system(cls, system):
+        "Compile a {station:{neighbor:line,...},...} system."
+        stations = list(system)
+        index = dict((s, i) for i, s in enumerate(stations))
+        lines, line_index = [], {}
+        offsets = array.array('i', [0])
+        neighbors, line_ids = array.array('i'), array.array('i')
+        for station in stations:
+            for neighbor, line in system[station].items():
+                if line not in line_index:
+                    line_index[line] = len(lines)
+                    lines.append(line)
+                neighbors.append(index[neighbor])
+                line_ids.append(line_index[line])
+            offsets.append(len(neighbors))
+        return cls(stations, lines, offsets, neighbors, line_ids)
+
+    def ride(self, here, there):
+        """Return the shortest path from here to there (the same one
+        shortest_path_search finds on the system), or Fail."""
+        a, b = self.index[here], self.index[there]
+        if a == b:
+            return [here]
+        offsets, neighbors = self.offsets, self.neighbors
+        parents = array.array('i', [-1]) * len(self.stations)
+        parents[a] = a
+        frontier = collections.deque([a])
+        while frontier:
+            last = frontier.popleft()
+            for k in range(offsets[last], offsets[last + 1]):
+                station = neighbors[k]
+                if parents[station] == -1:
+                    parents[station] = k  # the track taken to get here
+                    if station == b:
+                        return self._path(a, b, parents)
+                    frontier.append(station)
+        return []
+
+    def _path(self, a, b, tracks):
+        "Follow the tracks taken back from b to a; return a named path."
+        path = [self.stations[b]]
+        while b != a:
+            k = tracks[b]
+            path.append(self.lines[self.line_ids[k]])
+            b = bisect.bisect_right(self.offsets, k) - 1  # the track's start
+            path.append(self.stations[b])
+        path.reverse()
+        return path
+
+    def save(self, filename):
+        "Write the compiled system to a compact binary file."
+        names = '\n'.join(self.stations + self.lines).encode('utf-8')
+        with open(filename, 'wb') as f:
+            f.write(
+                self.HEADER.pack(self.MAGIC, len(self.stations),
+                                 len(self.lines), len(self.neighbors),
+                                 len(names)))
+            f.write(names)
+            for numbers in (self.offsets, self.neighbors, self.line_ids):
+                f.write(little_endian(numbers).tobytes())
+
+    @classmethod
+    def load(cls, filename):
+        "Read a compiled system written by save."
+        with open(filename, 'rb') as f:
+            data = f.read()
+        magic, n_stations, n_lines, n_tracks, size = cls.HEADER.unpack_from(
+            data)
+        if magic != cls.MAGIC:
+            raise ValueError('%s is not a compiled subway system' % filename)
+        position = cls.HEADER.size
+        names = data[position:position + size].decode('utf-8').split('\n')
+        position += size
+        arrays = []
+        for count in (n_stations + 1, n_tracks, n_tracks):
+            numbers = array.array('i')
+            numbers.frombytes(data[position:position +
+                                   count * numbers.itemsize])
+            arrays.append(little_endian(numbers))
+            position += count * numbers.itemsize
+        return cls(names[:n_stations], names[n_stations:n_stations + n_lines],
+                   *arrays)
+
+
+def little_endian(numbers):
+    "Return the array in little-endian byte order (swapping a copy if not)."
+    if sys.byteorder == 'little':
+        return numbers
+    numbers = array.array(numbers.typecode, numbers)
+    numbers.byteswap()
+    return numbers
 
 
 def test_ride():
@@ -110,6 +519,133 @@ def test_ride():
         'park', 'government', 'state', 'aquarium', 'maverick', 'airport',
         'suffolk', 'revere', 'wonderland'
     ])
+    index = route_index(boston)
+    assert route_index(boston) is index
+    for a in ('mit', 'mattapan', 'newton', 'wonderland'):
+        for b in boston:
+            assert len(index.ride(a, b)) == len(ride(a, b))
+    assert index.ride('mit', 'mit') == ['mit']
+
+    system = subway(red='a b c', blue='c d')
+    assert len(path_states(longest_ride(system))) == 4
+    system['d']['e'] = system['e']['d'] = 'blue'
+    invalidate_route_index(system)
+    assert path_states(longest_ride(system)) == ['a', 'b', 'c', 'd', 'e']
+    system['x'] = {}
+    invalidate_route_index(system)
+    assert route_index(system).ride('a', 'x') == []
+    system = subway(red='a b c d', blue='d e')
+    assert len(route_index(system).ride('a', 'e')) == 9
+    del system['d']['e'], system['e']['d']
+    system['a']['e'] = system['e']['a'] = 'blue'
+    invalidate_route_index(system)
+    assert route_index(system).ride('a', 'e') == ['a', 'blue', 'e']
+    system['a']['e'] = system['e']['a'] = 'green'
+    invalidate_route_index(system)
+    assert route_index(system).ride('a', 'e') == ['a', 'green', 'e']
+    systems = [subway(red='a b') for _ in range(ROUTE_INDEXES + 3)]
+    for system in systems:
+        route_index(system)
+    assert len(_route_indexes) == ROUTE_INDEXES
+    assert route_index(systems[-1]) is route_index(systems[-1])
+
+    compiled = CompiledSystem.from_system(boston)
+    assert compiled.ride('mit', 'government') == ride('mit', 'government')
+    assert compiled.ride('mattapan', 'foresthills') == ride(
+        'mattapan', 'foresthills')
+    assert compiled.ride('mit', 'mit') == ['mit']
+    filename = os.path.join(tempfile.mkdtemp(), 'boston.subway')
+    compiled.save(filename)
+    loaded = CompiledSystem.load(filename)
+    assert loaded.stations == compiled.stations
+    assert loaded.lines == compiled.lines
+    assert loaded.ride('newton', 'alewife') == ride('newton', 'alewife')
+    os.remove(filename)
+
+    assert timed_ride('mit', 'government') == ride('mit', 'government')
+    # Changing at park costs more than riding one stop further to downtown.
+    assert timed_ride('charles', 'state', transfer=5) == [
+        'charles', 'red', 'park', 'red', 'downtown', 'orange', 'state'
+    ]
+    assert timed_ride('charles', 'state', transfer=5,
+                      travel_time={('park', 'downtown'): 20}) == [
+                          'charles', 'red', 'park', 'green', 'government',
+                          'blue', 'state'
+                      ]
+    assert timed_ride('mit', 'mit') == ['mit']
+
+    system = synthetic_subway(300, 12)
+    dynamic = DynamicRouteIndex(system)
+    assert len(dynamic.longest_ride()) == len(longest_ride(system))
+    rng = random.Random(1)
+    for step in range(40):
+        a, b = rng.sample(sorted(system), 2)
+        grown = dynamic.trees_grown
+        if step % 4 == 0:
+            dynamic.remove_station(a)
+        elif b in system[a]:
+            dynamic.remove_track(a, b)
+        else:
+            dynamic.add_track(a, b, 'line%d' % step)
+            assert len(dynamic.longest_ride()) == len(longest_ride(system))
+            assert dynamic.trees_grown == grown  # every tree was mended
+        assert len(dynamic.longest_ride()) == len(longest_ride(system))
+        for here, there in (rng.sample(sorted(system), 2) for _ in range(5)):
+            assert len(dynamic.ride(here, there)) == len(
+                route_index(system).ride(here, there))
+    dynamic = DynamicRouteIndex(subway(red='a b c'))
+    dynamic.add_line('blue', 'c d e')
+    assert dynamic.ride('a', 'e') == ['a', 'red', 'b', 'red', 'c', 'blue',
+                                      'd', 'blue', 'e']
+    dynamic.add_station('f', {'a': 'green', 'e': 'green'})
+    assert len(dynamic.ride('a', 'e')) == 5
+    dynamic.remove_line('green')
+    assert dynamic.ride('a', 'f') == [] and len(dynamic.ride('a', 'e')) == 9
+    dynamic = DynamicRouteIndex(subway(red='a b c'))
+    dynamic.longest_ride()  # grow every tree before the system changes
+    dynamic.add_line('blue', 'c d e')
+    assert dynamic.ride('a', 'e') == ['a', 'red', 'b', 'red', 'c', 'blue',
+                                      'd', 'blue', 'e']
+    assert len(dynamic.longest_ride()) == 9
+    dynamic = DynamicRouteIndex(subway(red='a b', blue='c d'))
+    assert dynamic.ride('a', 'd') == [] and dynamic.ride('d', 'a') == []
+    dynamic.add_track('b', 'c', 'green')
+    assert len(dynamic.ride('a', 'd')) == len(dynamic.ride('d', 'a')) == 7
+    dynamic.remove_station('b')
+    assert dynamic.ride('a', 'd') == [] and len(dynamic.ride('d', 'c')) == 3
+    for here, there in (('zz', 'a'), ('a', 'zz')):
+        try:
+            dynamic.ride(here, there)
+            assert False, 'expected a KeyError'
+        except KeyError:
+            pass
+    assert 'zz' not in dynamic.system
+
+    system = synthetic_subway(60, 4)
+    dynamic = DynamicRouteIndex(system)
+    rng = random.Random(2)
+    for step in range(100):
+        dynamic.longest_ride()
+        a, b = rng.sample(sorted(system), 2)
+        if step % 7 == 0:
+            dynamic.remove_station(a)
+        elif step % 5 == 0:
+            dynamic.add_line('new%d' % step, '%s n%d %s' % (a, step, b))
+        elif b in system[a]:
+            dynamic.remove_track(a, b)
+        else:
+            dynamic.add_track(a, b, 'line%d' % step)
+        fresh = RouteIndex(system)
+        for here in system:
+            for there in system:
+                assert len(dynamic.ride(here, there)) == len(
+                    fresh.ride(here, there))
+    dynamic = DynamicRouteIndex(subway(red='a b d e', blue='a c d'))
+    assert dynamic.ride('a', 'e') == ['a', 'red', 'b', 'red', 'd', 'red', 'e']
+    dynamic.remove_track('b', 'd')
+    assert dynamic.ride('a', 'e') == ['a', 'blue', 'c', 'blue', 'd', 'red',
+                                      'e']
+    assert dynamic.trees_grown == 1
     print('test_ride passes')
 
 
@@ -0,0 +1,162 @@
+'''
+Water pouring problem, searched a whole frontier at a time with NumPy.
+'''
+
+import numpy as np
+
+from water_pouring import BITMAP_LIMIT, Fail, more_pour_problem, pour_reachable
+
+CODE_LIMIT = 1 << 63  # states numbered by int64 codes
+
+
+def vectorized_pour_problem(capacities, goal, start=None):
+    """Solve more_pour_problem(capacities, goal, start) with a breadth-first
+    search that expands a layer at a time.  The layer is an array of states
+    (one row of glass levels per state, also kept as mixed-radix codes);
+    all fill, empty and pour successors of the layer are computed at once,
+    and new states are picked out of them with array operations.  States
+    are discovered in the same order as in more_pour_problem, so the paths
+    are the same.  Problems with too many states for int64 codes are left
+    to more_pour_problem."""
+    if start is None:
+        start = (0, ) * len(capacities)
+    if not pour_reachable(capacities, goal, start):
+        return Fail
+    if goal in start:
+        return [tuple(start)]
+    size = 1
+    for capacity in capacities:
+        size *= capacity + 1
+    if size > CODE_LIMIT:
+        return more_pour_problem(capacities, goal, start)
+    n = len(capacities)
+    caps = np.array(capacities, dtype=np.int64)
+    radix = caps + 1
+    weights = np.concatenate(([1], np.cumprod(radix)[:-1])).astype(np.int64)
+    actions, columns = pour_actions(n)
+
+    def decode(codes):
+        return codes[:, None] // weights % radix
+
+    code = int(np.dot(start, weights))
+    explored = Explored(size)
+    explored.add(np.array([code], dtype=np.int64))
+    layers = [(np.array([code], dtype=np.int64), None, None)]
+    while len(layers[-1][0]):
+        codes = layers[-1][0]
+        levels = decode(codes)
+        # Successor codes in the order more_pour_successors makes them:
+        # one row per state, one column per action.
+        fill = codes[:, None] + (caps - levels) * weights
+        empty = codes[:, None] - levels * weights
+        amount = np.minimum(levels[:, :, None], (caps - levels)[:, None, :])
+        pour = codes[:, None, None] + amount * (weights[None, :] -
+                                                weights[:, None])
+        children = np.concatenate((fill, empty, pour.reshape(len(codes), -1)),
+                                  axis=1)[:, columns].ravel()
+        parents = np.arange(children.size) // len(columns)
+        moves = np.tile(np.arange(len(columns)), len(codes))
+        # First appearance of each child decides its parent and its place
+        # in the next layer; like a dict, the last action from that parent
+        # that makes it is the one kept.
+        unique, first, inverse = np.unique(children, return_index=True,
+                                           return_inverse=True)
+        inverse = inverse.ravel()
+        same_parent = parents == parents[first][inverse]
+        move = np.full(unique.size, -1)
+        np.maximum.at(move, inverse[same_parent], moves[same_parent])
+        new = ~explored.contains(unique)
+        order = np.argsort(first[new], kind='stable')
+        codes = unique[new][order]
+        layer = (codes, parents[first[new][order]], move[new][order])
+        explored.add(codes)
+        layers.append(layer)
+        hits = np.flatnonzero((decode(codes) == goal).any(axis=1))
+        if hits.size:
+            return unpack_layers(layers, int(hits[0]), decode, actions)
+    return Fail
+
+
+def pour_actions(n):
+    """Return the actions of an n-glass pouring problem, in the order
+    more_pour_successors makes them, and for each one its column in the
+    (fill, empty, pour i->j) arrays built by vectorized_pour_problem."""
+    actions, columns = [], []
+    for i in range(n):
+        actions.append(('fill', i))
+        columns.append(i)
+        actions.append(('empty', i))
+        columns.append(n + i)
+        for j in range(n):
+            if i != j:
+                actions.append(('pour', i, j))
+                columns.append(2 * n + i * n + j)
+    return actions, np.array(columns)
+
+
+def unpack_layers(layers, position, decode, actions):
+    """Rebuild the [state, action, state, ...] path that ends at this
+    position of the last layer."""
+    path = []
+    for codes, parents, moves in reversed(layers):
+        state = decode(codes[position:position + 1])[0]
+        path.append(tuple(int(level) for level in state))
+        if parents is not None:
+            path.append(actions[moves[position]])
+            position = parents[position]
+    path.reverse()
+    return path
+
+
+class Explored:
+    """The codes of explored states: a bitmap with one bit per possible
+    state when there are few enough of them, else a sorted array."""
+
+    def __init__(self, size):
+        if size <= BITMAP_LIMIT:
+            self.seen = np.zeros((size >> 3) + 1, dtype=np.uint8)
+            self.codes = None
+        else:
+            self.seen = None
+            self.codes = np.empty(0, dtype=np.int64)
+
+    def contains(self, codes):
+        if self.seen is not None:
+            return (self.seen[codes >> 3] >> (codes & 7)) & 1 == 1
+        # Not np.isin, which may build a table as long as the codes' range.
+        found = np.searchsorted(self.codes, codes)
+        found[found == self.codes.size] = 0
+        return self.codes.take(found, mode='clip') == codes
+
+    def add(self, codes):
+        if self.seen is not None:
+            bits = np.left_shift(1, codes & 7).astype(np.uint8)
+            np.bitwise_or.at(self.seen, codes >> 3, bits)
+        else:
+            self.codes = np.union1d(self.codes, codes)
+
+
+def test_vectorized_pour():
+    "vectorized pour tests."
+    for capacities in ((1, 2, 4, 8), (1, 3, 9, 27), (3, 5, 8), (4, 9),
+                       (8, 12, 16, 20, 24)):
+        for goal in range(12):
+            assert vectorized_pour_problem(
+                capacities, goal) == more_pour_problem(capacities, goal)
+    assert vectorized_pour_problem((4, 9), 6, (1, 1)) == more_pour_problem(
+        (4, 9), 6, (1, 1))
+    assert vectorized_pour_problem((4, 9), 3, (3, 0)) == [(3, 0)]
+    assert vectorized_pour_problem((1000, ) * 7, 500) == Fail
+    big = (2001, 2003, 2005, 2007, 2009, 2011)  # codes past int64
+    assert vectorized_pour_problem(big, 8) == more_pour_problem(big, 8)
+    # Too many states for the bitmap: explored codes in a sorted array.
+    for capacities, goal in (((13, 29, 61, 97, 101), 60),
+                             ((64, 63, 62, 61, 60), 1)):
+        assert vectorized_pour_problem(capacities,
+                                       goal) == more_pour_problem(
+                                           capacities, goal)
+    print('test_vectorized_pour passes')
+
+
+if __name__ == '__main__':
+    test_vectorized_pour()
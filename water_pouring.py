@@ -2,82 +2,537 @@
 Water pouring problem.
 '''
 
+import array
+import collections
 import doctest
+import heapq
+import functools
+import itertools
+import math
+import time
 
 Fail = []
 
 
-def shortest_path_search(start, successors, is_goal):
+def shortest_path_search(start, successors, is_goal, stats=None):
     """Find the shortest path from start state to a state
-    such that is_goal(state) is true."""
+    such that is_goal(state) is true.
+    The frontier is a deque of states, and every discovered state remembers
+    the (parent, action) that first reached it, so the goal is tested when a
+    state is generated and the path is built only once, at the end.
+    If stats is a SearchStats, it records the work done."""
+    if stats is not None:
+        successors, is_goal = stats.watch(successors, is_goal)
     if is_goal(start):
-        return [start]
-    explored = set()
-    frontier = [[start]]
+        return finish([start], stats)
+    parents = {start: None}
+    frontier = collections.deque([start])
     while frontier:
-        path = frontier.pop(0)
-        last_state = path[-1]
-        if is_goal(last_state):
-            return path
-        explored.add(last_state)
-        for state, action in successors(last_state).items():
-            if state not in explored:
-                path2 = path + [action, state]
-                frontier.append(path2)
+        last_state = frontier.popleft()
+        for (state, action) in successors(last_state).items():
+            if state not in parents:
+                parents[state] = (last_state, action)
+                if is_goal(state):
+                    if stats is not None:
+                        stats.sizes(len(frontier), len(parents))
+                    return finish(build_path(parents, state), stats)
+                frontier.append(state)
+            elif stats is not None:
+                stats.duplicates += 1
+        if stats is not None:
+            stats.sizes(len(frontier), len(parents))
+    return finish(Fail, stats)
+
+
+def bidirectional_search(start, goal, successors, predecessors=None):
+    """Find the shortest path from start state to the goal state by searching
+    forward from start and backward from goal, a whole layer at a time, until
+    the two searches meet.  predecessors(state) => {state:action,...} gives
+    the states from which an action leads to state; it defaults to
+    successors, which is right when every action can be undone by one that
+    is labelled the same (as on a subway map)."""
+    if predecessors is None:
+        predecessors = successors
+    if start == goal:
+        return [start]
+    forward, backward = {start: None}, {goal: None}
+    depths = {start: 0}, {goal: 0}
+    layers = [start], [goal]
+    while layers[0] and layers[1]:
+        side = 0 if len(layers[0]) <= len(layers[1]) else 1
+        expand = successors if side == 0 else predecessors
+        mine, other = (forward, backward) if side == 0 else (backward,
+                                                             forward)
+        depth, other_depth = depths[side], depths[1 - side]
+        meet, shortest, layer = None, INFINITY, []
+        for last_state in layers[side]:
+            for (state, action) in expand(last_state).items():
+                if state not in mine:
+                    mine[state] = (last_state, action)
+                    depth[state] = depth[last_state] + 1
+                    layer.append(state)
+                    if state in other and other_depth[state] < shortest:
+                        meet, shortest = state, other_depth[state]
+        if meet is not None:
+            return join_paths(forward, backward, meet)
+        layers = (layer, layers[1]) if side == 0 else (layers[0], layer)
     return Fail
 
 
-def lowest_cost_search(start, successors, is_goal, action_cost):
+def join_paths(forward, backward, state):
+    """Join the path from start to state (from forward parent pointers) with
+    the path from state to goal (from backward child pointers)."""
+    path = build_path(forward, state)
+    while backward[state] is not None:
+        state, action = backward[state]
+        path.append(action)
+        path.append(state)
+    return path
+
+
+def lowest_cost_search(start, successors, is_goal, action_cost, stats=None):
     """Return the lowest cost path, starting from start state,
     and considering successors(state) => {state:action,...},
     that ends in a state for which is_goal(state) is true,
     where the cost of a path is the sum of action costs,
     which are given by action_cost(action)."""
+    return astar_search(start, successors, is_goal, action_cost,
+                        no_heuristic, stats)
+
+
+def astar_search(start, successors, is_goal, action_cost, heuristic,
+                 stats=None):
+    """Like lowest_cost_search, but the frontier is ordered by path cost plus
+    heuristic(state), an estimate of the remaining cost that must never be too
+    high.  A state whose estimate is infinite is never put on the frontier.
+    The frontier is a heap of (estimate, order, state) entries; best holds the
+    live entry of every state on the frontier, so a cheaper (or equally
+    cheap, later) path just pushes a new entry and the old one is skipped
+    when it is popped.  If stats is a SearchStats, it records the work done."""
+    if stats is not None:
+        successors, is_goal = stats.watch(successors, is_goal)
     if is_goal(start):
-        return [start]
+        return finish([start], stats)
     explored = set()
-    frontier = [[start]]
+    parents = {start: None}
+    costs = {start: 0}
+    order = itertools.count(1)
+    best = {start: (heuristic(start), 0)}
+    frontier = [best[start] + (start, )]
     while frontier:
-        path = frontier.pop(0)
-        last_state = final_state(path)
+        estimate, n, last_state = heapq.heappop(frontier)
+        if best.get(last_state) != (estimate, n):
+            continue  # stale entry, replaced by a better path
+        del best[last_state]
         if is_goal(last_state):
-            return path
+            if stats is not None:
+                stats.sizes(len(best), len(parents))
+            return finish(build_path(parents, last_state), stats)
         explored.add(last_state)
-        pcost = path_cost(path)
+        pcost = costs.pop(last_state)
         for (state, action) in successors(last_state).items():
+            if stats is not None and state in parents:
+                stats.duplicates += 1
             if state not in explored:
                 total_cost = pcost + action_cost(action)
-                path2 = path + [(action, total_cost), state]
-                add_to_frontier(frontier, path2)
+                old = costs.get(state)
+                if old is None or total_cost <= old:
+                    estimate = total_cost + heuristic(state)
+                    if estimate == INFINITY:
+                        continue
+                    entry = (estimate, next(order))
+                    best[state] = entry
+                    costs[state] = total_cost
+                    parents[state] = (last_state, (action, total_cost))
+                    heapq.heappush(frontier, entry + (state, ))
+        if stats is not None:
+            stats.sizes(len(best), len(parents))
+    return finish(Fail, stats)
+
+
+class SearchStats:
+    """What a search that was given stats=SearchStats() did: how many states
+    it expanded, how many successors it generated and how many of those it
+    had seen before, the largest its frontier and its set of seen states
+    grew, and the time spent in successors, in goal tests, and in total.
+    on_expand(state, successors) and on_goal(path), if given, are called
+    as states are expanded and when a goal is found."""
+
+    def __init__(self, on_expand=None, on_goal=None):
+        self.on_expand = on_expand
+        self.on_goal = on_goal
+        self.expanded = 0  # states whose successors were generated
+        self.generated = 0  # successors made, including seen ones
+        self.duplicates = 0  # successors that had been seen before
+        self.seen = 0  # states put on the frontier, start included
+        self.max_frontier = 0
+        self.max_seen = 0
+        self.successors_time = 0.0
+        self.goal_time = 0.0
+        self.elapsed = 0.0
+        self.started = None
+
+    @property
+    def frontier_time(self):
+        "Time spent outside successors and goal tests: frontier upkeep."
+        return self.elapsed - self.successors_time - self.goal_time
+
+    def watch(self, successors, is_goal):
+        """Start timing a search; return successors and is_goal wrapped to
+        count and time their calls."""
+        clock = time.perf_counter
+
+        def watched_successors(state):
+            started = clock()
+            result = successors(state)
+            self.successors_time += clock() - started
+            self.expanded += 1
+            self.generated += len(result)
+            if self.on_expand is not None:
+                self.on_expand(state, result)
+            return result
+
+        def watched_is_goal(state):
+            started = clock()
+            result = is_goal(state)
+            self.goal_time += clock() - started
+            return result
+
+        self.started = clock()
+        return watched_successors, watched_is_goal
+
+    def sizes(self, frontier, seen):
+        "Note the sizes of the frontier and of the seen states."
+        self.seen = seen
+        self.max_frontier = max(self.max_frontier, frontier)
+        self.max_seen = max(self.max_seen, seen)
+
+    def done(self, path):
+        "Stop timing; report the path to on_goal if the search found one."
+        self.elapsed += time.perf_counter() - self.started
+        if path and self.on_goal is not None:
+            self.on_goal(path)
+
+    def __repr__(self):
+        return ('SearchStats(expanded=%d, generated=%d, duplicates=%d, '
+                'max_frontier=%d, max_seen=%d, elapsed=%.6f)' %
+                (self.expanded, self.generated, self.duplicates,
+                 self.max_frontier, self.max_seen, self.elapsed))
+
+
+def finish(path, stats):
+    "Return the path a search found, telling stats (if any) it is done."
+    if stats is not None:
+        stats.done(path)
+    return path
+
+
+class LazySuccessors:
+    """The successors of one state, made from an iterable of (state, action)
+    pairs only as far as a search reads them, and remembered, so that a
+    later search reads the same ones again and goes on from there.  It
+    reads like a {state: action} dict; a state that comes up twice keeps
+    its first action.  Asking for its len (as SearchStats does) makes them
+    all."""
+
+    def __init__(self, pairs):
+        self.pairs = iter(pairs)
+        self.made = {}
+        self.order = []  # the (state, action) pairs made so far
+
+    def items(self):
+        i = 0
+        while i < len(self.order) or self._make_one():
+            yield self.order[i]
+            i += 1
+
+    def _make_one(self):
+        "Make the next new successor; return False if there are no more."
+        if self.pairs is not None:
+            for state, action in self.pairs:
+                if state not in self.made:
+                    self.made[state] = action
+                    self.order.append((state, action))
+                    return True
+            self.pairs = None
+        return False
+
+    def _make_all(self):
+        while self.pairs is not None:
+            self._make_one()
+        return self.made
+
+    def __iter__(self):
+        return (state for state, _ in self.items())
+
+    def __len__(self):
+        return len(self._make_all())
+
+    def __getitem__(self, state):
+        return self._make_all()[state]
+
+    def get(self, state, default=None):
+        return self._make_all().get(state, default)
+
+
+def lazy_successors(moves):
+    """Turn moves(state) => iterable of (state, action) pairs into a
+    successors function that makes them only as they are read."""
+
+    def successors(state):
+        return LazySuccessors(moves(state))
+
+    return successors
+
+
+SuccessorCacheInfo = collections.namedtuple(
+    'SuccessorCacheInfo', 'hits misses maxsize currsize')
+
+
+class SuccessorCache:
+    """Wrap a successors function so that the successors of the maxsize
+    most recently expanded states are kept and handed out again, to this
+    search and to later ones over the same problem.  With lazy_successors
+    the kept successors are lazy too, made only as far as any search has
+    read them.  cache_info() and hit_rate tell how well it is working."""
+
+    def __init__(self, successors, maxsize=100000):
+        self.successors = successors
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def __call__(self, state):
+        result = self.cache.get(state)
+        if result is not None:
+            self.hits += 1
+            self.cache.move_to_end(state)
+            return result
+        self.misses += 1
+        result = self.cache[state] = self.successors(state)
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return result
+
+    def cache_info(self):
+        return SuccessorCacheInfo(self.hits, self.misses, self.maxsize,
+                                  len(self.cache))
+
+    @property
+    def hit_rate(self):
+        "The share of calls answered from the cache (0 before any call)."
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def cache_clear(self):
+        self.cache.clear()
+        self.hits = self.misses = 0
+
+
+INFINITY = float('inf')
+
+
+def no_heuristic(state):
+    "The heuristic that knows nothing; turns A* into lowest cost search."
+    return 0
+
+
+def search_stream(start, successors, is_goal, action_cost,
+                  heuristic=no_heuristic, paths_per_state=1,
+                  progress_every=None):
+    """Generate the goal paths of a lowest cost (or, with a heuristic, A*)
+    search as they are found, in order of nondecreasing cost, as ('goal',
+    path) pairs.  Every state may be expanded by up to paths_per_state
+    different paths, so raising it yields the k best paths rather than just
+    the best path to each goal state.  If progress_every is given, a
+    ('progress', {'expanded': ..., 'frontier': ..., 'bound': ...}) pair is
+    generated after that many expansions, bound being the least cost any
+    path still to come can have.  Stop asking whenever you like; the
+    generator keeps its frontier, so asking again resumes the search."""
+    counts = collections.Counter()
+    order = itertools.count()
+    # A node is (state, (action, total_cost), parent node), a linked path.
+    frontier = [(heuristic(start), next(order), 0, (start, None, None))]
+    expanded = 0
+    while frontier:
+        estimate, _, pcost, node = heapq.heappop(frontier)
+        last_state = node[0]
+        if counts[last_state] >= paths_per_state:
+            continue
+        counts[last_state] += 1
+        if is_goal(last_state):
+            yield 'goal', node_path(node)
+            continue
+        for (state, action) in successors(last_state).items():
+            if counts[state] < paths_per_state:
+                total_cost = pcost + action_cost(action)
+                estimate = total_cost + heuristic(state)
+                if estimate < INFINITY:
+                    heapq.heappush(frontier,
+                                   (estimate, next(order), total_cost,
+                                    (state, (action, total_cost), node)))
+        expanded += 1
+        if progress_every and expanded % progress_every == 0:
+            yield 'progress', {
+                'expanded': expanded,
+                'frontier': len(frontier),
+                'bound': frontier[0][0] if frontier else INFINITY
+            }
+
+
+def node_path(node):
+    "Turn a (state, action, parent node) linked path into a path list."
+    path = []
+    while node is not None:
+        state, action, node = node
+        path.append(state)
+        if action is not None:
+            path.append(action)
+    path.reverse()
+    return path
+
+
+def take_paths(stream, limit=None, time_budget=None):
+    """Return the goal paths from a search_stream, stopping after limit paths
+    or time_budget seconds (checked at every path or progress report); the
+    stream can be passed in again to get more."""
+    deadline = None if time_budget is None else time.time() + time_budget
+    paths = []
+    if limit is not None and limit <= 0:
+        return paths
+    for kind, value in stream:
+        if kind == 'goal':
+            paths.append(value)
+            if limit is not None and len(paths) >= limit:
+                break
+        if deadline is not None and time.time() >= deadline:
+            break
+    return paths
+
+
+def iterative_deepening_search(start, successors, is_goal, max_depth=None,
+                               table_size=None):
+    """Find the shortest path, like shortest_path_search, with depth-first
+    searches to depth 1, 2, 3, ... (up to max_depth, if given), keeping in
+    memory only the current path and, if table_size is given, a table of at
+    most that many recently seen states, which saves searching them again."""
+    if is_goal(start):
+        return [start]
+    for limit in itertools.count(1):
+        if max_depth is not None and limit > max_depth:
+            break
+        table = None if table_size is None else TranspositionTable(table_size)
+        path, on_path, cut_off = [start], set([start]), False
+        stack = [iter(successors(start).items())]
+        while stack:
+            depth = len(stack)
+            for (state, action) in stack[-1]:
+                if state in on_path:
+                    continue
+                if table is not None and not table.visit(state, depth):
+                    continue
+                if is_goal(state):
+                    return path + [action, state]
+                if depth == limit:
+                    cut_off = True
+                    continue
+                path += [action, state]
+                on_path.add(state)
+                stack.append(iter(successors(state).items()))
+                break
+            else:
+                stack.pop()
+                if len(path) > 1:
+                    on_path.discard(path.pop())
+                    path.pop()
+        if not cut_off:
+            break  # there was nothing deeper to search
+    return Fail
+
+
+def ida_star_search(start, successors, is_goal, action_cost,
+                    heuristic=no_heuristic, table_size=None):
+    """Find the lowest cost path, like astar_search, with depth-first
+    searches that give up on a path when its cost plus heuristic exceeds a
+    bound; each search raises the bound to the least estimate that exceeded
+    it.  Memory holds only the current path and, if table_size is given, a
+    table of at most that many recently seen states."""
+    if is_goal(start):
+        return [start]
+    bound = heuristic(start)
+    while bound < INFINITY:
+        table = None if table_size is None else TranspositionTable(table_size)
+        path, on_path, next_bound = [start], set([start]), INFINITY
+        stack = [iter(successors(start).items())]
+        while stack:
+            pcost = path_cost(path)
+            for (state, action) in stack[-1]:
+                if state in on_path:
+                    continue
+                total_cost = pcost + action_cost(action)
+                estimate = total_cost + heuristic(state)
+                if estimate > bound:
+                    next_bound = min(next_bound, estimate)
+                    continue
+                if table is not None and not table.visit(state, total_cost):
+                    continue
+                path += [(action, total_cost), state]
+                if is_goal(state):
+                    return path
+                on_path.add(state)
+                stack.append(iter(successors(state).items()))
+                break
+            else:
+                stack.pop()
+                if len(path) > 1:
+                    on_path.discard(path.pop())
+                    path.pop()
+        bound = next_bound
     return Fail
 
 
-def pour_problem(X, Y, goal, start=(0, 0)):
+class TranspositionTable:
+    """The cost at which each of the most recently seen states was reached,
+    holding at most size states; the least recently used go first."""
+
+    def __init__(self, size):
+        self.size = size
+        self.costs = collections.OrderedDict()
+
+    def visit(self, state, cost):
+        """Record that state was reached at cost; return False if it was
+        already reached at no more than that."""
+        old = self.costs.get(state)
+        if old is not None and old <= cost:
+            self.costs.move_to_end(state)
+            return False
+        self.costs[state] = cost
+        self.costs.move_to_end(state)
+        if len(self.costs) > self.size:
+            self.costs.popitem(last=False)
+        return True
+
+
+def pour_problem(X, Y, goal, start=(0, 0), stats=None):
     '''
     X and Y are the capacity of glasses; (x, y) is current fill levels and represents a state.
     The goal is a level that can be in either glass.
     Start at start state and follow successors until we reach the goal.
-    Keep track of frotier and previously explored; fail when frontier.
+    If stats is a SearchStats, it records the work done.
     '''
-    if goal in start:
-        return [start]
-    explored = set()  # set of states we have visited
-    frontier = [[start]]  # ordered list of paths we have blazed
-    while frontier:
-        path = frontier.pop(0)
-        (x, y) = path[-1]  # Last state in the first path of the frontier
-        for (state, action) in successors(x, y, X, Y).items():
-            if state not in explored:
-                explored.add(state)
-                path2 = path + [action, state]
-                if goal in state:
-                    return path2
-                else:
-                    frontier.append(path2)
-    return Fail
 
+    def pour_successors(state):
+        (x, y) = state
+        return successors(x, y, X, Y)
+
+    def is_goal(state):
+        return goal in state
+
+    return shortest_path_search(start, pour_successors, is_goal, stats)
 
-def more_pour_problem(capacities, goal, start=None):
+
+def more_pour_problem(capacities, goal, start=None, packed=False,
+                      successors=None):
     """The first argument is a tuple of capacities (numbers) of glasses; the
     goal is a number which we must achieve in some glass.  start is a tuple
     of starting levels for each glass; if None, that means 0 for all.
@@ -85,11 +540,300 @@ def more_pour_problem(capacities, goal, start=None):
     Keep track of frontier and previously explored; fail when no frontier.
     On success return a path: a [state, action, state2, ...] list, where an
     action is one of ('fill', i), ('empty', i), ('pour', i, j), where
-    i and j are indices indicating the glass number."""
+    i and j are indices indicating the glass number.
+    With packed=True the search runs on integer-encoded states (see
+    packed_pour_search), which takes much less memory on big problems.
+    Unreachable goals fail at once, without a search (see pour_reachable).
+    successors, if given, replaces more_pour_successors(capacities): e.g. a
+    SuccessorCache shared by the searches of many goals."""
 
     def is_goal(state):
         return goal in state
 
+    if start is None:
+        start = (0, ) * len(capacities)
+    if not pour_reachable(capacities, goal, start):
+        return Fail
+    if packed:
+        return packed_pour_search(capacities, goal, start)
+    if successors is None:
+        successors = more_pour_successors(capacities)
+    return shortest_path_search(start, successors, is_goal)
+
+
+def packed_pour_search(capacities, goal, start):
+    """Breadth-first search for more_pour_problem where a state is one
+    integer, the glass levels written as digits in a mixed radix of
+    (capacity + 1) per glass, so actions are just additions.  The explored
+    set is a bitmap (see explored_marker), and each layer of the search is
+    kept in arrays of (state, parent position, action number); states become
+    tuples again only in the returned path.  Every state but the start has
+    some glass empty or full, so when the bitmap for all states would be too
+    big, a search that reaches many states keeps it for just those (see
+    boundary_marker)."""
+    if goal in start:
+        return [start]
+    indices = range(len(capacities))
+    weights, size = [], 1
+    for capacity in capacities:
+        weights.append(size)
+        size *= capacity + 1
+    actions = []
+    for i in indices:
+        actions.append(('fill', i))
+        actions.append(('empty', i))
+        actions.extend(('pour', i, j) for j in indices if i != j)
+
+    def decode(code):
+        return tuple(code // weights[i] % (capacities[i] + 1) for i in indices)
+
+    def expand(code):
+        "Return {state: action number} for the successors of code."
+        levels = decode(code)
+        result = {}
+        a = 0
+        for i in indices:
+            level, weight = levels[i], weights[i]
+            result[code + (capacities[i] - level) * weight] = a
+            result[code - level * weight] = a + 1
+            a += 2
+            for j in indices:
+                if i != j:
+                    amount = min(level, capacities[j] - levels[j])
+                    result[code + amount * (weights[j] - weight)] = a
+                    a += 1
+        return result
+
+    if size <= 1 << 63:
+        new_codes = functools.partial(array.array, 'q')
+    else:  # too many states for 64-bit codes: keep Python ints
+        new_codes = list
+    code = sum(level * weight for level, weight in zip(start, weights))
+    mark = explored_marker(size)
+    if size > BITMAP_LIMIT:
+        rank, count = boundary_ranker(capacities)
+        if count <= BITMAP_LIMIT:
+            mark = boundary_marker(rank, count, decode)
+
+    mark(code)
+    layers = [(new_codes([code]), array.array('l', [-1]),
+               array.array('H', [0]))]
+    while layers[-1][0]:
+        codes, parents, moves = (new_codes(), array.array('l'),
+                                 array.array('H'))
+        for position, code in enumerate(layers[-1][0]):
+            for child, a in expand(code).items():
+                if mark(child):
+                    codes.append(child)
+                    parents.append(position)
+                    moves.append(a)
+                    if goal in decode(child):
+                        layers.append((codes, parents, moves))
+                        return unpack_path(layers, len(codes) - 1, decode,
+                                           actions)
+        layers.append((codes, parents, moves))
+    return Fail
+
+
+BITMAP_LIMIT = 1 << 26  # most states (bits) worth a bitmap: 8 MB
+
+
+def explored_marker(size):
+    """Return a function mark(code) for integer states in range(size) that
+    records code as explored and says whether it was new.  Small spaces get a
+    bitmap with one bit per possible state; in big ones only a small part is
+    ever reached, so a set of ints takes less room."""
+    if size > BITMAP_LIMIT:
+        explored = set()
+
+        def mark(code):
+            if code in explored:
+                return False
+            explored.add(code)
+            return True
+    else:
+        explored = bytearray((size >> 3) + 1)
+
+        def mark(code):
+            byte, bit = code >> 3, 1 << (code & 7)
+            if explored[byte] & bit:
+                return False
+            explored[byte] |= bit
+            return True
+
+    return mark
+
+
+def boundary_marker(rank, count, decode):
+    """Return a function mark(code) like explored_marker's, for a search whose
+    states other than the start are numbered by rank(decode(code)) < count
+    (see boundary_ranker).  Codes go in a set while that is smaller than a
+    bitmap of count bits (a set takes some 64 bits or more per code), and
+    into the bitmap after that: ranking a code costs more than hashing it,
+    so only searches that reach a good part of the boundary pay for it."""
+    explored = set()
+    mark_rank = None
+
+    def mark(code):
+        nonlocal explored, mark_rank
+        if mark_rank is None:
+            if code in explored:
+                return False
+            explored.add(code)
+            if len(explored) > count >> 6:
+                mark_rank = explored_marker(count)
+                for old in explored:
+                    position = rank(decode(old))
+                    if position is not None:
+                        mark_rank(position)
+                explored = None
+            return True
+        position = rank(decode(code))
+        return position is None or mark_rank(position)
+
+    return mark
+
+
+def boundary_ranker(capacities):
+    """Return (rank, count): rank(levels) numbers the states where some glass
+    is empty or full as 0 to count - 1 (and is None for any other state).
+    Every action leaves a glass empty or full, so these are the only states
+    a search reaches besides its start; there are prod(c + 1) - prod(c - 1)
+    of them, about (2 / c) of all states for n glasses of capacity c.
+    States are grouped by the first glass i that is empty or full: glasses
+    before i hold 1 to c - 1 and glasses after it anything."""
+    n = len(capacities)
+    radixes, bases, blocks = [], [], []
+    count = 0
+    for i in range(n):
+        radix = [capacities[k] - 1 if k < i else capacities[k] + 1
+                 for k in range(n) if k != i]
+        block = 1
+        for r in radix:
+            block *= r
+        radixes.append(radix)
+        bases.append(count)
+        blocks.append(block)
+        count += 2 * block
+
+    def rank(levels):
+        for i, level in enumerate(levels):
+            if level == 0 or level == capacities[i]:
+                break
+        else:
+            return None
+        position = 0
+        digits = (levels[k] - 1 if k < i else levels[k] for k in range(n)
+                  if k != i)
+        for radix, digit in zip(radixes[i], digits):
+            position = position * radix + digit
+        return bases[i] + (level != 0) * blocks[i] + position
+
+    return rank, count
+
+
+def pour_reachable(capacities, goal, start=None):
+    """Can some glass ever hold goal?  Every level is a multiple of the gcd
+    of the capacities and the start levels, and no more than the biggest
+    capacity; starting from empty glasses (the default) every such level is
+    reachable, so the answer is exact.  From other starts a True answer may
+    still lead to a failed search."""
+    if start is None:
+        start = (0, ) * len(capacities)
+    return pour_heuristic(capacities, goal)(start) != INFINITY
+
+
+def two_glass_pour(X, Y, goal):
+    """Return the same path as pour_problem(X, Y, goal), without a search.
+    From empty glasses there are only two ways to go that do not undo
+    themselves: keep filling X and pouring it into Y, emptying Y when it is
+    full, or the same the other way round.  A shortest path is the first of
+    the two to put goal in a glass (the X way on a tie)."""
+    if not pour_reachable((X, Y), goal):
+        return Fail
+    ways = [[(0, 0)], [(0, 0)]]
+    while goal not in ways[0][-1] and goal not in ways[1][-1]:
+        x, y = ways[0][-1]
+        if x == 0:
+            ways[0] += ['fill X', (X, y)]
+        elif y == Y:
+            ways[0] += ['empty Y', (x, 0)]
+        else:
+            amount = min(x, Y - y)
+            ways[0] += ['X->Y', (x - amount, y + amount)]
+        x, y = ways[1][-1]
+        if y == 0:
+            ways[1] += ['fill Y', (x, Y)]
+        elif x == X:
+            ways[1] += ['empty X', (0, y)]
+        else:
+            amount = min(y, X - x)
+            ways[1] += ['X<-Y', (x + amount, y - amount)]
+    return ways[0] if goal in ways[0][-1] else ways[1]
+
+
+def unpack_path(layers, position, decode, actions):
+    """Rebuild the [state, action, state, ...] path that ends at this
+    position of the last layer of a packed_pour_search."""
+    path = []
+    for codes, parents, moves in reversed(layers):
+        path.append(decode(codes[position]))
+        path.append(actions[moves[position]])
+        position = parents[position]
+    path.pop()  # the start state has no action
+    path.reverse()
+    return path
+
+
+def pour_table(capacities, start=None):
+    """Answer more_pour_problem(capacities, goal, start) for every goal at
+    once, from one search of all the states reachable from start.  Return a
+    {goal: path} dict with the same path more_pour_problem would return for
+    each reachable goal; goals missing from the dict are unreachable."""
+    if start is None:
+        start = (0, ) * len(capacities)
+    return goal_table(explore(start, more_pour_successors(capacities)))
+
+
+def pour_problem_table(X, Y, start=(0, 0)):
+    """Answer pour_problem(X, Y, goal, start) for every goal at once; see
+    pour_table."""
+
+    def pour_successors(state):
+        return successors(state[0], state[1], X, Y)
+
+    return goal_table(explore(start, pour_successors))
+
+
+def explore(start, successors):
+    """Search breadth-first everything reachable from start; return the
+    {state: (parent, action)} pointers, in the order states were found."""
+    parents = {start: None}
+    frontier = collections.deque([start])
+    while frontier:
+        last_state = frontier.popleft()
+        for (state, action) in successors(last_state).items():
+            if state not in parents:
+                parents[state] = (last_state, action)
+                frontier.append(state)
+    return parents
+
+
+def goal_table(parents):
+    """Return {level: path} with the path to the first state found that has
+    a glass holding that level."""
+    table = {}
+    for state in parents:
+        for level in state:
+            if level not in table:
+                table[level] = build_path(parents, state)
+    return table
+
+
+def more_pour_successors(capacities):
+    """Return the successors function of more_pour_problem for glasses with
+    these capacities: state => {state: action, ...}."""
+
     def replace(state, pos, value):
         result = list(state)
         result[pos] = value
@@ -110,13 +854,28 @@ def more_pour_problem(capacities, goal, start=None):
 
         return dict(result)
 
-    if goal % 2 == 1 and all(map(lambda x: x % 2 == 0, capacities)):
-        return Fail
-    if all(map(lambda x: x < goal, capacities)):
-        return Fail
-    if start is None:
-        start = (0, ) * len(capacities)
-    return shortest_path_search(start, successors, is_goal)
+    return successors
+
+
+def more_pour_moves(capacities):
+    """Return moves(state) => (state, action) pairs for glasses with these
+    capacities, in the order of more_pour_successors; with lazy_successors
+    it makes the same successors (a state new to a search has only one
+    action leading to it), but only as far as a search reads them."""
+
+    def moves(state):
+        for i, level in enumerate(state):
+            yield state[:i] + (capacities[i], ) + state[i + 1:], ('fill', i)
+            yield state[:i] + (0, ) + state[i + 1:], ('empty', i)
+            for j, other in enumerate(state):
+                if i != j:
+                    amount = min(level, capacities[j] - other)
+                    new_state = list(state)
+                    new_state[i] -= amount
+                    new_state[j] += amount
+                    yield tuple(new_state), ('pour', i, j)
+
+    return moves
 
 
 def add_to_frontier(frontier, path):
@@ -141,6 +900,18 @@ def final_state(path):
     return path[-1]
 
 
+def build_path(parents, state):
+    """Follow the {state: (parent, action)} pointers back from state
+    and return the [start, action, state, ...] path that ends there."""
+    path = [state]
+    while parents[state] is not None:
+        state, action = parents[state]
+        path.append(action)
+        path.append(state)
+    path.reverse()
+    return path
+
+
 def path_states(path):
     "Return a list of states in this path."
     return path[0::2]
@@ -199,12 +970,12 @@ def bridge_successors2(state):
         return dict(((here - frozenset([a, b, light]),
                       there | frozenset([a, b, light])), (a, b, '->'))
                     for a in here
-                    if a is not light for b in here if b is not light)
+                    if a != light for b in here if b != light)
     else:
         return dict(((here | frozenset([a, b, light]),
                       there - frozenset([a, b, light])), (a, b, '<-'))
                     for a in there
-                    if a is not light for b in there if b is not light)
+                    if a != light for b in there if b != light)
 
 
 def bridge_successors3(state):
@@ -228,18 +999,104 @@ def bridge_successors3(state):
         for a in state[light] for b in state[light])
 
 
-def bridge_problem(here):
+def bridge_problem(here, stats=None):
     '''
     Find the fastest (least elapsed time) path to the goal in the bridge problem.
+    If stats is a SearchStats, it records the work done.
     '''
 
-    def bridge_goal(state):
-        here, _ = state
-        return not here or len(here) == 1 and 'light' in here
-
     start = (frozenset(here) | frozenset(['light']), frozenset())
     return lowest_cost_search(start, bridge_successors2, bridge_goal,
-                              bridge_cost)
+                              bridge_cost, stats)
+
+
+def canonical_bridge_problem(here, stats=None):
+    """Find the fastest path in the bridge problem, like bridge_problem, on
+    canonical states: a state is (counts, light), where counts[i] is how
+    many people with the i-th fastest time are still here and light is 0
+    when the light is here, 1 when it is over there.  People with equal
+    times are interchangeable, so each is a separate person here but they
+    make only one state, and each crossing is made only once.
+    If stats is a SearchStats, it records the work done."""
+    speeds = sorted(set(here))
+    totals = tuple(here.count(speed) for speed in speeds)
+    start = (totals, 0)
+    return astar_search(start, canonical_bridge_successors(speeds, totals),
+                        canonical_bridge_goal, bridge_cost,
+                        canonical_bridge_heuristic(speeds, totals), stats)
+
+
+def canonical_bridge_successors(speeds, totals):
+    """Return the successors function for canonical bridge states of people
+    with these speeds, totals[i] of them with speeds[i].  Rote showed that
+    some fastest crossing only ever sends over the two fastest people, the
+    fastest with the slowest one here, or the two slowest here, and sends
+    back the fastest or the second fastest; only those moves are made, and
+    each once.  The action is (slower, faster, arrow)."""
+    people = [i for i in range(len(speeds)) for _ in range(totals[i])]
+    first, second = (people + [None, None])[:2]
+
+    def move(counts, moving, change):
+        counts = list(counts)
+        for i in moving:
+            counts[i] += change
+        return tuple(counts)
+
+    def successors(state):
+        counts, light = state
+        result = {}
+        if light == 0:
+            here = [i for i in range(len(speeds)) if counts[i]]
+            if sum(counts) == 1:
+                pairs = [(here[0], )]
+            else:
+                slowest = here[-1]
+                next_slowest = slowest if counts[slowest] >= 2 else here[-2]
+                pairs = [(slowest, next_slowest)]
+                if counts[first] >= 1 + (first == slowest):
+                    pairs.append((slowest, first))
+                if counts[first] >= 1 + (first == second) and counts[second]:
+                    pairs.append((second, first))
+            for pair in pairs:
+                result[(move(counts, pair, -1),
+                        1)] = (speeds[pair[0]], speeds[pair[-1]], '->')
+        else:
+            for i in sorted(set([first, second])):
+                if counts[i] < totals[i]:
+                    result[(move(counts, [i], +1), 0)] = (speeds[i],
+                                                          speeds[i], '<-')
+        return result
+
+    return successors
+
+
+def canonical_bridge_goal(state):
+    "Everybody is over there."
+    counts, _ = state
+    return not any(counts)
+
+
+def canonical_bridge_heuristic(speeds, totals):
+    "bridge_heuristic for canonical bridge states."
+    fastest = speeds[0] if speeds else 0
+
+    def h(state):
+        counts, light = state
+        people = [speeds[i] for i in reversed(range(len(speeds)))
+                  for _ in range(counts[i])]
+        if not people:
+            return 0
+        trips = (len(people) + 1) // 2
+        returns = trips - 1 if light == 0 else trips
+        return sum(people[0::2]) + returns * fastest
+
+    return h
+
+
+def bridge_goal(state):
+    "Everybody is over there (the light may be, too)."
+    here, _ = state
+    return not here or len(here) == 1 and 'light' in here
 
 
 def elapsed_time(path):
@@ -266,6 +1123,42 @@ def bridge_cost(action):
     return max(a, b)
 
 
+def bridge_heuristic(state):
+    """An admissible estimate of the time left in the bridge problem.
+    Each trip over takes at most two of the people still here, so the trips
+    cost at least the slowest person plus the third slowest and so on; each
+    trip back (one between trips over, plus one first if the light is over
+    there) costs at least as much as the fastest person."""
+    here, there = state
+    people = sorted((p for p in here if p != 'light'), reverse=True)
+    if not people:
+        return 0
+    trips = (len(people) + 1) // 2
+    returns = trips - 1 if 'light' in here else trips
+    fastest = min(p for p in here | there if p != 'light')
+    return sum(people[0::2]) + returns * fastest
+
+
+def pour_heuristic(capacities, goal):
+    """Return an admissible heuristic for more_pour_problem(capacities, goal):
+    every level reachable from a state is a multiple of the gcd of the
+    capacities and the current levels, and no glass holds more than its
+    capacity, so other goals are unreachable; anything else takes at least
+    one more action."""
+
+    def h(state):
+        if goal in state:
+            return 0
+        if not capacities or goal > max(capacities):
+            return INFINITY
+        if goal % functools.reduce(math.gcd, state, gcd) != 0:
+            return INFINITY
+        return 1
+
+    gcd = functools.reduce(math.gcd, capacities, 0)
+    return h
+
+
 def missionaries_cannibals_problem(start=(3, 3, 1, 0, 0, 0), goal=None):
     '''
     Solve the missionaries and cannibals problem.
@@ -317,6 +1210,81 @@ def missionaries_cannibals_successors(state):
     return result
 
 
+def missionaries_cannibals_predecessors(state):
+    """Find the states from which one boat trip leads to this state,
+    as a dict of {state: action} pairs."""
+    M1, C1, B1, M2, C2, B2 = state
+    result = {}
+    for dm, dc in ((1, 0), (2, 0), (0, 1), (0, 2), (1, 1)):
+        if B1:
+            previous = (M1 - dm, C1 - dc, B2, M2 + dm, C2 + dc, B1)
+        else:
+            previous = (M1 + dm, C1 + dc, B2, M2 - dm, C2 - dc, B1)
+        if min(previous) >= 0:
+            action = missionaries_cannibals_successors(previous).get(state)
+            if action is not None:
+                result[previous] = action
+    return result
+
+
+def general_missionaries_cannibals(M=3, C=3, boat=2):
+    """Solve missionaries and cannibals for M missionaries, C cannibals and a
+    boat that carries 1 to boat people, who all start on side 1.  Return the
+    path in the format of missionaries_cannibals_problem (Fail if there is
+    none); with boat=2 it is the very same path.
+    The search state is (m, c, b): the missionaries and cannibals on side 1
+    and 1 if the boat is there, numbered ((m * (C + 1)) + c) * 2 + b, so the
+    explored set is a bytearray and each parent pointer one array item.  The
+    loads the boat can take are tabled once, in the order the successors of
+    missionaries_cannibals_successors come in."""
+    loads = ([(m, 0) for m in range(1, boat + 1)] +
+             [(0, c) for c in range(1, boat + 1)] +
+             [(m, c) for m in range(1, boat) for c in range(1, boat - m + 1)])
+    names = ['M' * m + 'C' * c for (m, c) in loads]
+    dining = bytearray((M + 1) * (C + 1))
+    for m in range(M + 1):
+        for c in range(C + 1):
+            dining[m * (C + 1) + c] = 0 < m < c or 0 < M - m < C - c
+
+    def state(index):
+        m, c, b = index // (2 * (C + 1)), index // 2 % (C + 1), index % 2
+        return (m, c, b, M - m, C - c, 1 - b)
+
+    start, goal = (M * (C + 1) + C) * 2 + 1, 0
+    parents = array.array('l', [-1]) * (2 * (M + 1) * (C + 1))
+    moves = array.array('l', [-1]) * len(parents)
+    explored = bytearray(len(parents))
+    explored[start] = 1
+    frontier = collections.deque([start])
+    while frontier and not explored[goal]:
+        index = frontier.popleft()
+        if dining[index // 2]:
+            continue
+        m, c, b = index // (2 * (C + 1)), index // 2 % (C + 1), index % 2
+        sign = 1 if b else -1
+        for load, (dm, dc) in enumerate(loads):
+            m2, c2 = m - sign * dm, c - sign * dc
+            if 0 <= m2 <= M and 0 <= c2 <= C:
+                child = (m2 * (C + 1) + c2) * 2 + 1 - b
+                if not explored[child]:
+                    explored[child] = 1
+                    parents[child], moves[child] = index, load
+                    if child == goal:
+                        break
+                    frontier.append(child)
+    if not explored[goal]:
+        return Fail
+    path = [state(goal)]
+    index = goal
+    while index != start:
+        name = names[moves[index]]
+        path += [name + '->' if index % 2 == 0 else '<-' + name,
+                 state(parents[index])]
+        index = parents[index]
+    path.reverse()
+    return path
+
+
 def test_bridge():
     "tests."
     assert bridge_successors((frozenset([1, 'light']), frozenset([]), 3)) == {
@@ -387,6 +1355,20 @@ def test_bridge():
         (frozenset([2, 3, 4]), frozenset([5]), 0): (set([3]), '<-')
     }
 
+    for here in ([1, 2, 5, 10], [1, 2, 5, 10, 15, 20], [1, 2, 4, 8, 16, 32],
+                 [3, 7, 11, 13, 17, 19, 23], [5], []):
+        assert elapsed_time(canonical_bridge_problem(here)) == elapsed_time(
+            bridge_problem(here))
+    # People with equal times are separate people here.
+    assert [
+        elapsed_time(canonical_bridge_problem([1, 1, 2, 3, 5, 8, 13, 21][:N]))
+        for N in range(9)
+    ] == [0, 1, 1, 4, 7, 12, 18, 28, 42]
+    assert elapsed_time(canonical_bridge_problem(list(range(1, 26)))) == 226
+    assert path_actions(canonical_bridge_problem([1, 2, 5, 10])) == [
+        ((2, 1, '->'), 2), ((1, 1, '<-'), 3), ((10, 5, '->'), 13),
+        ((2, 2, '<-'), 15), ((2, 1, '->'), 17)
+    ]
     print('bridge tests pass')
 
 
@@ -412,6 +1394,15 @@ def test_missionaries_cannibals():
         (0, 0, 0, 3, 3, 1): 'CC->'
     }
     print(missionaries_cannibals_problem())
+    for M in range(6):
+        for C in range(6):
+            assert general_missionaries_cannibals(
+                M, C) == missionaries_cannibals_problem((M, C, 1, 0, 0, 0))
+    assert general_missionaries_cannibals(4, 4) == Fail
+    path = general_missionaries_cannibals(4, 4, 3)
+    assert len(path) == 19 and 'CCC->' in path and 'MMM->' in path
+    assert general_missionaries_cannibals(1000, 1000, 4)[-1] == (0, 0, 0,
+                                                                 1000, 1000, 1)
     print('missionaries and cannibals problem tests pass')
 
 
@@ -430,9 +1421,248 @@ def test_shortest_path_search():
 
     assert shortest_path_search(5, test_successors,
                                 is_goal) == [5, '->', 6, '->', 7, '->', 8]
+    assert shortest_path_search(8, test_successors, is_goal) == [8]
+    assert shortest_path_search(0, lambda s: {(s + 1) % 5: '+'},
+                                is_goal) == Fail
+
+    parents = {1: None, 2: (1, 'a'), 3: (2, 'b')}
+    assert build_path(parents, 3) == [1, 'a', 2, 'b', 3]
+    assert build_path(parents, 1) == [1]
     print('shortest path search tests success')
 
 
+def test_lowest_cost_search():
+    "lowest cost search tests."
+    graph = {
+        'a': {'b': 5, 'c': 1},
+        'b': {'d': 1},
+        'c': {'b': 1, 'd': 7},
+        'd': {}
+    }
+
+    def graph_successors(state):
+        return dict((s, (state, s, cost)) for s, cost in graph[state].items())
+
+    def edge_cost(action):
+        return action[2]
+
+    path = lowest_cost_search('a', graph_successors, lambda s: s == 'd',
+                              edge_cost)
+    assert path_states(path) == ['a', 'c', 'b', 'd']
+    assert path_cost(path) == 3
+    assert lowest_cost_search('d', graph_successors, lambda s: s == 'a',
+                              edge_cost) == Fail
+    print('lowest cost search tests success')
+
+
+def test_astar():
+    "A* search tests."
+    for here in ([1, 2, 5, 10], [1, 2, 5, 10, 15, 20], [1, 2, 4, 8, 16, 32],
+                 [3, 7, 11, 13, 17, 19, 23]):
+        start = (frozenset(here) | frozenset(['light']), frozenset())
+        plain, informed = SearchStats(), SearchStats()
+        cost = elapsed_time(
+            lowest_cost_search(start, bridge_successors2, bridge_goal,
+                               bridge_cost, plain))
+        assert elapsed_time(
+            astar_search(start, bridge_successors2, bridge_goal, bridge_cost,
+                         bridge_heuristic, informed)) == cost
+        assert informed.expanded <= plain.expanded
+
+    assert bridge_heuristic((frozenset([1, 2, 5, 10, 'light']),
+                             frozenset())) == 10 + 2 + 1
+    assert bridge_heuristic((frozenset([5]), frozenset([1, 'light']))) == 6
+
+    capacities = (1, 3, 9, 27)
+    for goal in (13, 26, 28):
+        path = astar_search((0, 0, 0, 0), more_pour_successors(capacities),
+                            lambda state: goal in state, lambda action: 1,
+                            pour_heuristic(capacities, goal))
+        assert len(path) == len(more_pour_problem(capacities, goal))
+    assert pour_heuristic((8, 12), 3)((0, 0)) == INFINITY
+    print('A* search tests success')
+
+
+def test_bidirectional_search():
+    "bidirectional search tests."
+
+    def line_successors(state):
+        return dict((s, '->' if s > state else '<-')
+                    for s in (state - 1, state + 1) if 0 <= s <= 20)
+
+    def line_predecessors(state):
+        return dict((s, '<-' if s > state else '->')
+                    for s in (state - 1, state + 1) if 0 <= s <= 20)
+
+    assert bidirectional_search(5, 8, line_successors,
+                                line_predecessors) == [
+                                    5, '->', 6, '->', 7, '->', 8
+                                ]
+    assert bidirectional_search(3, 3, line_successors) == [3]
+    assert bidirectional_search(3, 30, line_successors,
+                                line_predecessors) == Fail
+
+    for start in ((3, 3, 1, 0, 0, 0), (2, 2, 1, 0, 0, 0), (3, 2, 1, 0, 0, 0)):
+        goal = (0, 0, 0) + start[:3]
+        path = bidirectional_search(start, goal,
+                                    missionaries_cannibals_successors,
+                                    missionaries_cannibals_predecessors)
+        assert len(path) == len(missionaries_cannibals_problem(start))
+        for state, action, state2 in zip(path[0::2], path[1::2], path[2::2]):
+            assert missionaries_cannibals_successors(state)[state2] == action
+    assert missionaries_cannibals_predecessors((3, 1, 0, 0, 2, 1)) == {
+        (3, 3, 1, 0, 0, 0): 'CC->',
+        (3, 2, 1, 0, 1, 0): 'C->'
+    }
+    print('bidirectional search tests success')
+
+
+def test_iterative_deepening():
+    "iterative deepening tests."
+    for table_size in (None, 0, 10, 1000):
+        for start in ((3, 3, 1, 0, 0, 0), (2, 2, 1, 0, 0, 0),
+                      (3, 2, 1, 0, 0, 0), (4, 4, 1, 0, 0, 0)):
+            path = iterative_deepening_search(
+                start, missionaries_cannibals_successors,
+                lambda state: state == (0, 0, 0) + start[:3],
+                table_size=table_size)
+            assert len(path) == len(missionaries_cannibals_problem(start))
+        for goal in (2, 5, 13, 28):
+            path = iterative_deepening_search(
+                (0, 0, 0, 0), more_pour_successors((1, 3, 9, 27)),
+                lambda state: goal in state, 6, table_size)
+            assert len(path) == len(more_pour_problem((1, 3, 9, 27), goal))
+        for here in ([1, 2, 5, 10], [1, 2, 4, 8, 16], [3, 7, 11]):
+            start = (frozenset(here) | frozenset(['light']), frozenset())
+            path = ida_star_search(start, bridge_successors2, bridge_goal,
+                                   bridge_cost, bridge_heuristic, table_size)
+            assert elapsed_time(path) == elapsed_time(bridge_problem(here))
+    assert iterative_deepening_search(5, lambda s: {s + 1: '->'},
+                                      lambda s: s == 8) == [
+                                          5, '->', 6, '->', 7, '->', 8
+                                      ]
+    table = TranspositionTable(2)
+    assert table.visit('a', 3) and not table.visit('a', 3)
+    assert table.visit('a', 2) and table.visit('b', 1) and table.visit('c', 1)
+    assert list(table.costs) == ['b', 'c']
+    print('iterative deepening tests success')
+
+
+def test_search_stats():
+    "search instrumentation tests."
+    expanded, goals = [], []
+    stats = SearchStats(on_expand=lambda state, succ: expanded.append(state),
+                        on_goal=goals.append)
+    path = pour_problem(4, 9, 6, stats=stats)
+    assert goals == [path]
+    assert stats.expanded == len(expanded) and expanded[0] == (0, 0)
+    assert stats.expanded < stats.generated <= 6 * stats.expanded
+    assert 0 < stats.duplicates < stats.generated
+    assert stats.max_seen == stats.seen <= 4 * 9
+    assert 0 < stats.max_frontier < stats.max_seen
+    assert stats.elapsed >= stats.successors_time + stats.goal_time
+
+    stats = SearchStats()
+    assert elapsed_time(bridge_problem([1, 2, 5, 10], stats)) == 17
+    assert stats.expanded > 0 and stats.frontier_time >= 0
+
+    stats = SearchStats(on_goal=goals.append)
+    assert shortest_path_search(0, lambda s: {(s + 1) % 5: '+'},
+                                lambda s: s == 8, stats) == Fail
+    assert stats.expanded == 5 and stats.duplicates == 1
+    assert len(goals) == 1
+
+    stats = SearchStats()
+    assert shortest_path_search(0, lambda x: {x + 1: '+'}, lambda x: x == 2,
+                                stats) == [0, '+', 1, '+', 2]
+    assert (stats.expanded, stats.generated, stats.duplicates) == (2, 2, 0)
+    assert (stats.seen, stats.max_seen, stats.max_frontier) == (3, 3, 1)
+    stats = SearchStats()  # 1 leads back to 0 and on to 2, both seen
+    graph = {0: {1: 'a', 2: 'b'}, 1: {0: 'c', 2: 'd', 3: 'e'}, 2: {}}
+    assert shortest_path_search(0, graph.get, lambda x: x == 3, stats) == [
+        0, 'a', 1, 'e', 3]
+    assert (stats.expanded, stats.generated, stats.duplicates) == (2, 5, 2)
+    assert (stats.seen, stats.max_seen, stats.max_frontier) == (4, 4, 2)
+    stats = SearchStats()
+    assert lowest_cost_search(0, graph.get, lambda x: x == 3, lambda a: 1,
+                              stats) == [0, ('a', 1), 1, ('e', 2), 3]
+    assert (stats.expanded, stats.duplicates, stats.seen) == (3, 2, 4)
+    print('search stats tests success')
+
+
+def test_search_stream():
+    "streaming search tests."
+    start = (frozenset([1, 2, 5, 10, 'light']), frozenset())
+    stream = search_stream(start, bridge_successors2, bridge_goal, bridge_cost,
+                           bridge_heuristic, paths_per_state=10)
+    best = take_paths(stream, limit=2)
+    assert [elapsed_time(path) for path in best] == [17, 17]
+    assert path_actions(best[0]) != path_actions(best[1])
+    more = take_paths(stream, limit=3)
+    costs = [elapsed_time(path) for path in best + more]
+    assert costs == sorted(costs) and len(costs) == 5
+    assert all(bridge_goal(final_state(path)) for path in more)
+
+    reports = [value for kind, value in search_stream(
+        start, bridge_successors2, bridge_goal, bridge_cost,
+        progress_every=5) if kind == 'progress']
+    assert reports and all(r['expanded'] % 5 == 0 for r in reports)
+    bounds = [r['bound'] for r in reports]
+    assert bounds == sorted(bounds)
+    assert take_paths(search_stream(0, lambda s: {s + 1: '+'},
+                                    lambda s: s > 3, lambda a: 1),
+                      time_budget=0) == [[0, ('+', 1), 1, ('+', 2), 2,
+                                          ('+', 3), 3, ('+', 4), 4]]
+    print('streaming search tests success')
+
+
+def test_successor_cache():
+    "successor cache tests."
+    capacities = (13, 29, 61)
+    successors = SuccessorCache(more_pour_successors(capacities))
+    for goal in range(40):
+        assert more_pour_problem(capacities, goal,
+                                 successors=successors) == more_pour_problem(
+                                     capacities, goal)
+    info = successors.cache_info()
+    assert info.misses == info.currsize and info.hits > 10 * info.misses
+    assert successors.hit_rate == info.hits / (info.hits + info.misses)
+
+    made = []
+
+    def counted_moves(state):
+        for pair in more_pour_moves(capacities)(state):
+            made.append(pair)
+            yield pair
+
+    successors = SuccessorCache(lazy_successors(counted_moves), maxsize=50)
+    for goal in (1, 2, 3, 1, 2, 3):
+        assert more_pour_problem(capacities, goal,
+                                 successors=successors) == more_pour_problem(
+                                     capacities, goal)
+    lazy_count = len(made)
+    assert successors.cache_info().currsize == 50
+    assert successors.cache_info().hits > 0
+    successors.cache_clear()
+    assert successors.cache_info() == (0, 0, 50, 0)
+    shortest_path_search((0, 0, 0), successors, lambda state: 1 in state)
+    assert len(made) < lazy_count + 12 * successors.cache_info().misses
+
+    lazy = LazySuccessors(iter([('a', 1), ('b', 2), ('a', 3), ('c', 4)]))
+    first = lazy.items()
+    assert next(first) == ('a', 1) and lazy.order == [('a', 1)]
+    assert list(lazy.items()) == [('a', 1), ('b', 2), ('c', 4)]
+    assert list(first) == [('b', 2), ('c', 4)]
+    assert len(lazy) == 3 and lazy['c'] == 4 and lazy.get('d') is None
+    state = (3, 5, 0)
+    lazy = dict(lazy_successors(more_pour_moves(capacities))(state).items())
+    eager = more_pour_successors(capacities)(state)
+    assert list(lazy) == list(eager)
+    assert [state2 for state2 in lazy if lazy[state2] != eager[state2]
+            ] == [state]  # only the state itself, which a search has seen
+    print('successor cache tests success')
+
+
 def test_more_pour():
     "test pour problem."
     assert more_pour_problem((1, 2, 4, 8), 4) == [(0, 0, 0, 0), ('fill', 2),
@@ -443,6 +1673,58 @@ def test_more_pour():
     assert not any(more_pour_problem(starbucks, odd) for odd in (3, 5, 7, 9))
     assert all(more_pour_problem((1, 3, 9, 27), n) for n in range(28))
     assert more_pour_problem((1, 3, 9, 27), 28) == []
+    for capacities in ((1, 2, 4, 8), (1, 3, 9, 27), (3, 5, 8), (4, 9)):
+        for goal in range(10):
+            assert more_pour_problem(capacities, goal,
+                                     packed=True) == more_pour_problem(
+                                         capacities, goal)
+    assert more_pour_problem((4, 9), 6, (1, 1), packed=True) == [
+        (1, 1), ('fill', 1), (1, 9), ('pour', 1, 0), (4, 6)
+    ]
+    # More states than 64-bit codes can number.
+    big = (2001, 2003, 2005, 2007, 2009, 2011)
+    assert more_pour_problem(big, 8, packed=True) == more_pour_problem(big, 8)
+    table = pour_table((1, 3, 9, 27))
+    assert all(table[n] == more_pour_problem((1, 3, 9, 27), n)
+               for n in range(28))
+    assert 28 not in table
+    table = pour_table(starbucks)
+    assert [n for n in range(26) if n not in table] == [
+        n for n in range(26) if n % 4 or n > 24
+    ]
+    for X, Y in ((4, 9), (7, 9), (3, 5), (6, 8)):
+        table = pour_problem_table(X, Y)
+        for goal in range(max(X, Y) + 2):
+            assert table.get(goal, Fail) == pour_problem(X, Y, goal)
+    assert more_pour_problem((30, 41, 57, 70, 90), 89,
+                             packed=True) == more_pour_problem(
+                                 (30, 41, 57, 70, 90), 89)
+    assert more_pour_problem((500, 501, 499), 2,
+                             packed=True) == more_pour_problem(
+                                 (500, 501, 499), 2)
+    for capacities in ((3, 1, 4, 2), (5, 5), (2, 7, 1)):
+        rank, count = boundary_ranker(capacities)
+        ranks = [rank(state) for state in itertools.product(
+            *[range(c + 1) for c in capacities])]
+        ranked = sorted(r for r in ranks if r is not None)
+        assert ranked == list(range(count))
+        states = explore((0, ) * len(capacities),
+                         more_pour_successors(capacities))
+        assert len(states) <= count
+        mark = boundary_marker(rank, count, lambda levels: levels)
+        assert all(mark(state) for state in states)  # moves to the bitmap
+        assert not any(mark(state) for state in states)
+    for X in range(1, 16):
+        for Y in range(1, 16):
+            for goal in range(max(X, Y) + 2):
+                assert two_glass_pour(X, Y, goal) == pour_problem(X, Y, goal)
+                assert pour_reachable((X, Y), goal) == bool(
+                    pour_problem(X, Y, goal))
+    path = two_glass_pour(9973, 10007, 5000)
+    assert len(path) == len(pour_problem(9973, 10007, 5000))
+    assert not pour_reachable((6, 10, 15), 31)
+    assert more_pour_problem((), 0) == more_pour_problem((), 3) == Fail
+    assert pour_reachable((6, 10, 15), 1) and not pour_reachable((6, 10), 1)
     print('test_more_pour passes')
 
 
@@ -514,4 +1796,11 @@ if __name__ == '__main__':
     test_bridge()
     test_missionaries_cannibals()
     test_shortest_path_search()
+    test_lowest_cost_search()
+    test_astar()
+    test_bidirectional_search()
+    test_iterative_deepening()
+    test_search_stats()
+    test_search_stream()
+    test_successor_cache()
     test_more_pour()